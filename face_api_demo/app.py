@@ -5,12 +5,13 @@ Clean, modular Flask application with proper separation of concerns
 
 from flask import Flask, request, jsonify
 from flask_cors import CORS
+from werkzeug.exceptions import HTTPException
 from datetime import datetime
 import logging
 import uuid
 
 from config import settings, setup_logging
-from services import ImageProcessor, EmbeddingCache, FaceRecognitionService, SupabaseService
+from services import ImageProcessor, EmbeddingCache, FaceRecognitionService, get_supabase
 from models.schemas import (
     RegisterStudentResponse,
     RecognizeFacesResponse,
@@ -21,7 +22,7 @@ from models.schemas import (
     RecognizedStudent,
     FaceRegion
 )
-from utils import FileHandler, validate_image_file, validate_student_id, validate_class_id, get_now
+from utils import FileHandler, validate_image_file, validate_student_id, validate_class_id, get_now, TOO_LARGE_MSG
 
 # Setup logging
 logger = setup_logging(log_level="INFO" if not settings.FLASK_DEBUG else "DEBUG")
@@ -30,9 +31,13 @@ logger = setup_logging(log_level="INFO" if not settings.FLASK_DEBUG else "DEBUG"
 app = Flask(__name__)
 CORS(app)  # Enable CORS for all routes
 
+# Reject oversized bodies before Werkzeug buffers them; the slack covers
+# multipart boundaries and the small form fields sent alongside the image
+app.config['MAX_CONTENT_LENGTH'] = settings.IMAGE_MAX_SIZE + 64 * 1024
+
 # Initialize services
 face_service = FaceRecognitionService()
-supabase_service = SupabaseService()
+supabase_service = get_supabase()
 file_handler = FileHandler()
 
 logger.info("="*60)
@@ -144,6 +149,10 @@ def detect_faces():
         
         return jsonify(response.dict()), 200
     
+    except HTTPException:
+        # e.g. 413 from MAX_CONTENT_LENGTH when request.files is parsed
+        raise
+    
     except Exception as e:
         logger.error(f"Error in detect_faces: {e}")
         return jsonify(DetectFacesResponse(
@@ -244,6 +253,10 @@ def register_student():
         
         return jsonify(response.dict()), 200
     
+    except HTTPException:
+        # e.g. 413 from MAX_CONTENT_LENGTH when request.files is parsed
+        raise
+    
     except Exception as e:
         logger.error(f"Error in register_student: {e}")
         return jsonify(RegisterStudentResponse(
@@ -350,6 +363,10 @@ def recognize_faces():
         
         return jsonify(response.dict()), 200
     
+    except HTTPException:
+        # e.g. 413 from MAX_CONTENT_LENGTH when request.files is parsed
+        raise
+    
     except Exception as e:
         logger.error(f"Error in recognize_faces: {e}")
         return jsonify(RecognizeFacesResponse(
@@ -427,6 +444,7 @@ def sync_database():
     try:
         # Get class ID from request
         class_id = request.json.get('classId') if request.json else None
+        force = bool(request.json.get('force', False)) if request.json else False
         
         if not class_id:
             return jsonify({
@@ -434,6 +452,13 @@ def sync_database():
                 "error": "classId is required"
             }), 400
         
+        is_valid, error_msg = validate_class_id(class_id)
+        if not is_valid:
+            return jsonify({
+                "success": False,
+                "error": error_msg
+            }), 400
+        
         if not supabase_service.is_enabled():
             return jsonify({
                 "success": False,
@@ -444,8 +469,12 @@ def sync_database():
         from config.settings import get_class_database_path
         class_db_path = get_class_database_path(class_id)
         
-        logger.info(f"📥 Manual sync requested for class {class_id}")
-        student_count, message = supabase_service.sync_class_students(class_id, class_db_path)
+        logger.info(f"📥 Manual sync requested for class {class_id}" + (" (forced)" if force else ""))
+        # A manual sync must see students added to Supabase by other services,
+        # so it always lists the bucket instead of reusing the on-disk index
+        student_count, message = supabase_service.sync_class_bundle(
+            class_id, class_db_path, force=force, use_index=False
+        )
         
         # Reload embeddings cache
         face_service.embedding_cache._load_all_embeddings()
@@ -554,6 +583,15 @@ def not_found(error):
     }), 404
 
 
+@app.errorhandler(413)
+def request_too_large(error):
+    """Handle 413 errors"""
+    return jsonify({
+        "success": False,
+        "error": TOO_LARGE_MSG
+    }), 413
+
+
 @app.errorhandler(500)
 def internal_error(error):
     """Handle 500 errors"""
@@ -579,12 +617,8 @@ def initialize_database_on_startup():
         # Check face_database folder
         face_db_path = settings.DATABASE_FOLDER
         
-        # Count existing images
-        has_images = any(
-            f.name.lower().endswith(('.jpg', '.jpeg', '.png'))
-            for f in face_db_path.rglob('*')
-            if f.is_file()
-        )
+        # Look for any existing image
+        has_images = FileHandler.has_any_image(face_db_path)
         
         if has_images:
             logger.info(f"✅ Local database found with images")
@@ -598,7 +632,7 @@ def initialize_database_on_startup():
             # You can add class_id from environment variable or config
             default_class_id = "default"  # or from settings
             
-            student_count, message = supabase_service.sync_class_students(
+            student_count, message = supabase_service.sync_class_bundle(
                 default_class_id, 
                 face_db_path
             )
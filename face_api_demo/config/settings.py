@@ -23,6 +23,8 @@ class Settings(BaseSettings):
     SUPABASE_KEY: str = Field(default="", description="Supabase anon/public key")
     SUPABASE_BUCKET: str = Field(default="student-photos", description="Supabase storage bucket")
     SUPABASE_ENABLED: bool = Field(default=False, description="Enable Supabase cloud storage")
+    SUPABASE_SYNC_CONCURRENCY: int = Field(default=16, description="Max concurrent Storage requests during a class sync")
+    SUPABASE_INDEX_TTL: int = Field(default=600, description="Seconds a cached students/ listing stays valid (0 disables)")
     
     # ==================== DeepFace Settings ====================
     DEEPFACE_MODEL: str = Field(default="Facenet512", description="Face recognition model")
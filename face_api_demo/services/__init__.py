@@ -3,11 +3,12 @@
 from .image_processor import ImageProcessor
 from .embedding_cache import EmbeddingCache
 from .face_recognition_service import FaceRecognitionService
-from .supabase_service import SupabaseService
+from .supabase_service import SupabaseService, get_supabase
 
 __all__ = [
     'ImageProcessor',
     'EmbeddingCache', 
     'FaceRecognitionService',
-    'SupabaseService'
+    'SupabaseService',
+    'get_supabase'
 ]
@@ -3,9 +3,10 @@ Embedding Cache Service
 Stores and retrieves pre-computed face embeddings for fast recognition
 """
 
+import threading
 import numpy as np
 from pathlib import Path
-from typing import Dict, Optional, Tuple, List
+from typing import Dict, Optional, Tuple, List, Union
 import logging
 from deepface import DeepFace
 from datetime import datetime
@@ -32,6 +33,12 @@ class EmbeddingCache:
         """
         self.cache: Dict[str, np.ndarray] = {}
         self.metadata: Dict[str, Dict] = {}
+        # Contiguous (N, D) view of the cache for vectorized matching,
+        # rebuilt lazily whenever the cache changes. Every change bumps the
+        # version, so a rebuild that raced with a change is not kept
+        self._gallery: Optional[Tuple[List[str], np.ndarray]] = None
+        self._gallery_version = 0
+        self._gallery_lock = threading.Lock()
         self.model_name = settings.DEEPFACE_MODEL
         self.distance_metric = settings.DEEPFACE_DISTANCE_METRIC
         
@@ -57,6 +64,7 @@ class EmbeddingCache:
                     student_id = embedding_file.stem
                     embedding = np.load(str(embedding_file))
                     self.cache[student_id] = embedding
+                    self._invalidate_gallery()
                     
                     # Load metadata if exists
                     metadata_file = embedding_file.with_suffix('.json')
@@ -116,6 +124,7 @@ class EmbeddingCache:
             
             # Store in memory
             self.cache[student_id] = embedding
+            self._invalidate_gallery()
             
             # Store metadata
             if metadata is None:
@@ -147,18 +156,19 @@ class EmbeddingCache:
             logger.error(f"Error setting embedding for {student_id}: {e}")
             return False
     
-    def generate_embedding(self, image_path: str) -> Optional[np.ndarray]:
+    def generate_embedding(self, image_path: Union[str, np.ndarray]) -> Optional[np.ndarray]:
         """
         Generate face embedding from image using DeepFace
         
         Args:
-            image_path: Path to face image
+            image_path: Path to face image or already decoded BGR array
             
         Returns:
             512D numpy array or None on failure
         """
         try:
-            logger.debug(f"Generating embedding for: {image_path}")
+            if isinstance(image_path, str):
+                logger.debug(f"Generating embedding for: {image_path}")
             
             # Use DeepFace to generate embedding
             embedding_objs = DeepFace.represent(
@@ -287,12 +297,114 @@ class EmbeddingCache:
         Returns:
             List of (student_id, distance, confidence) tuples
         """
-        results = []
-        for embedding in query_embeddings:
-            match = self.find_best_match(embedding, threshold)
-            results.append(match)
+        if len(query_embeddings) == 0:
+            return []
         
-        return results
+        return self.find_best_matches_batch(
+            np.asarray(query_embeddings, dtype=np.float32),
+            threshold
+        )
+    
+    def _invalidate_gallery(self):
+        """Drop the matching gallery after a cache change (call after mutating self.cache)"""
+        with self._gallery_lock:
+            self._gallery_version += 1
+            self._gallery = None
+    
+    def _get_gallery(self) -> Tuple[List[str], np.ndarray]:
+        """
+        Get cached embeddings as parallel (student_ids, matrix) arrays
+        
+        Returns:
+            Tuple of (student_ids, float32 matrix of shape (N, D))
+        """
+        gallery = self._gallery
+        if gallery is not None:
+            return gallery
+        
+        version = self._gallery_version
+        items = list(self.cache.items())
+        student_ids = [student_id for student_id, _ in items]
+        matrix = np.stack([
+            np.asarray(embedding, dtype=np.float32).ravel()
+            for _, embedding in items
+        ])
+        gallery = (student_ids, matrix)
+        
+        # Keep the rebuild only if the cache did not change while it ran
+        with self._gallery_lock:
+            if self._gallery_version == version:
+                self._gallery = gallery
+        
+        return gallery
+    
+    def find_best_matches_batch(
+        self,
+        query_matrix: np.ndarray,
+        threshold: Optional[float] = None
+    ) -> List[Tuple[Optional[str], float, float]]:
+        """
+        Find best matches for a batch of embeddings with one matrix operation
+        
+        Args:
+            query_matrix: Query embeddings of shape (M, D)
+            threshold: Maximum distance threshold (uses config default if None)
+            
+        Returns:
+            List of (student_id, distance, confidence) tuples, one per query row
+        """
+        num_queries = len(query_matrix)
+        no_match = (None, float('inf'), 0.0)
+        
+        try:
+            if threshold is None:
+                threshold = settings.CONFIDENCE_THRESHOLD
+            
+            if num_queries == 0:
+                return []
+            
+            if not self.cache:
+                logger.warning("Cache is empty, no students to match against")
+                return [no_match] * num_queries
+            
+            student_ids, gallery = self._get_gallery()
+            queries = np.asarray(query_matrix, dtype=np.float32).reshape(num_queries, -1)
+            
+            # Distance matrix of shape (M, N)
+            if self.distance_metric == 'cosine':
+                query_norms = np.linalg.norm(queries, axis=1, keepdims=True)
+                gallery_norms = np.linalg.norm(gallery, axis=1)
+                distances = 1 - (queries @ gallery.T) / (query_norms * gallery_norms)
+            
+            elif self.distance_metric in ('euclidean', 'euclidean_l2'):
+                squared = (
+                    np.einsum('ij,ij->i', queries, queries)[:, None]
+                    - 2 * (queries @ gallery.T)
+                    + np.einsum('ij,ij->i', gallery, gallery)[None, :]
+                )
+                distances = np.sqrt(np.maximum(squared, 0))
+                if self.distance_metric == 'euclidean_l2':
+                    distances /= queries.shape[1]
+            
+            else:
+                logger.error(f"Unknown distance metric: {self.distance_metric}")
+                return [no_match] * num_queries
+            
+            best_indices = np.argmin(distances, axis=1)
+            best_distances = distances[np.arange(num_queries), best_indices]
+            
+            results = []
+            for best_index, best_distance in zip(best_indices.tolist(), best_distances.tolist()):
+                if best_distance <= threshold:
+                    results.append((student_ids[best_index], best_distance, 1.0 - best_distance))
+                else:
+                    results.append((None, best_distance, 0.0))
+            
+            return results
+        
+        except Exception as e:
+            logger.error(f"Error finding batch matches: {e}")
+            return [no_match] * num_queries
     
     def get_cache_stats(self) -> Dict:
         """
@@ -326,6 +438,8 @@ class EmbeddingCache:
             self.cache.clear()
             self.metadata.clear()
             logger.info("Cleared entire cache")
+        
+        self._invalidate_gallery()
     
     def delete_embedding(self, student_id: str, delete_from_disk: bool = True) -> bool:
         """
@@ -342,6 +456,7 @@ class EmbeddingCache:
             # Remove from memory
             if student_id in self.cache:
                 del self.cache[student_id]
+                self._invalidate_gallery()
             if student_id in self.metadata:
                 del self.metadata[student_id]
             
@@ -5,11 +5,15 @@ Core recognition logic with rate limiting and session management
 
 import time
 import uuid
-import json
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import Dict, List, Optional, Tuple
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
 from datetime import datetime
 import logging
+import numpy as np
+import orjson
 
 from config.settings import settings, get_session_path
 from services.image_processor import ImageProcessor
@@ -18,6 +22,9 @@ from utils import get_now
 
 logger = logging.getLogger(__name__)
 
+# Number of decoded frames buffered ahead of recognition in recognize_stream
+STREAM_PREFETCH_DEPTH = 2
+
 
 class FaceRecognitionService:
     """
@@ -139,7 +146,8 @@ class FaceRecognitionService:
         image_path: str,
         session_id: Optional[str] = None,
         preprocess: bool = True,
-        save_results: bool = True
+        save_results: bool = True,
+        image: Optional[np.ndarray] = None
     ) -> Dict:
         """
         Recognize faces in an image
@@ -149,6 +157,7 @@ class FaceRecognitionService:
             session_id: Optional session identifier for tracking
             preprocess: Whether to preprocess the image
             save_results: Whether to save results to session folder
+            image: Already decoded BGR image for image_path (skips reading it again)
             
         Returns:
             Recognition results dictionary
@@ -165,13 +174,15 @@ class FaceRecognitionService:
             
             logger.info(f"Recognizing faces (session: {session_id})")
             
-            # Preprocess image if requested
+            # Preprocess image in memory if requested
             if preprocess:
-                image_path = self.image_processor.preprocess_image(image_path)
+                image = self.image_processor.preprocess_image_array(image_path)
+            
+            source = image if image is not None else image_path
             
             # Extract all faces
             faces = self.image_processor.extract_faces_from_frame(
-                image_path,
+                source,
                 min_confidence=0.5
             )
             
@@ -186,41 +197,43 @@ class FaceRecognitionService:
             
             logger.info(f"Detected {len(faces)} face(s)")
             
-            # Generate embeddings for each face
-            face_embeddings = []
+            # Generate embeddings for each face into one contiguous matrix,
+            # keeping face metadata in a parallel list
+            emb_matrix: Optional[np.ndarray] = None
+            face_meta: List[Dict] = []
             for face in faces:
-                # Save face region temporarily
-                face_path = str(settings.TEMP_FOLDER / f"face_{uuid.uuid4()}.jpg")
-                self.image_processor.crop_face_region(
-                    image_path=image_path,
-                    face_region=face['region'],
-                    output_path=face_path
+                # Crop face region in memory
+                face_img = self.image_processor.crop_face_region(
+                    image_path=source,
+                    face_region=face['region']
                 )
                 
                 # Generate embedding
-                embedding = self.embedding_cache.generate_embedding(face_path)
-                face_embeddings.append({
-                    'face': face,
-                    'embedding': embedding,
-                    'face_path': face_path
-                })
-            
-            # Match against cached embeddings
+                embedding = self.embedding_cache.generate_embedding(face_img)
+                if embedding is None:
+                    continue
+                
+                if emb_matrix is None:
+                    emb_matrix = np.empty((len(faces), embedding.size), dtype=np.float32)
+                emb_matrix[len(face_meta)] = embedding.ravel()
+                face_meta.append(face)
+            
+            # Match all faces against cached embeddings in one batch
             recognized_students = []
-            for face_data in face_embeddings:
-                if face_data['embedding'] is not None:
-                    student_id, distance, confidence = self.embedding_cache.find_best_match(
-                        query_embedding=face_data['embedding'],
-                        threshold=settings.CONFIDENCE_THRESHOLD
-                    )
-                    
+            if face_meta:
+                matches = self.embedding_cache.find_best_matches_batch(
+                    query_matrix=emb_matrix[:len(face_meta)],
+                    threshold=settings.CONFIDENCE_THRESHOLD
+                )
+                
+                for face, (student_id, distance, confidence) in zip(face_meta, matches):
                     if student_id:
                         recognized_students.append({
                             'student_id': student_id,
                             'confidence': round(confidence, 4),
                             'distance': round(distance, 4),
-                            'face_region': face_data['face']['region'],
-                            'detection_confidence': face_data['face']['confidence']
+                            'face_region': face['region'],
+                            'detection_confidence': face['confidence']
                         })
             
             # Calculate processing time
@@ -255,6 +268,83 @@ class FaceRecognitionService:
                 'recognized_students': []
             }
     
+    def recognize_stream(
+        self,
+        image_paths: Iterable[str],
+        session_id: Optional[str] = None,
+        preprocess: bool = True,
+        save_results: bool = True
+    ) -> Iterator[Dict]:
+        """
+        Recognize faces in a stream of images
+        The next images are read and decoded in a background thread while
+        the current one is being recognized
+        
+        Args:
+            image_paths: Iterable of image paths (e.g. video frames)
+            session_id: Optional session identifier shared by all images
+            preprocess: Whether to preprocess each image
+            save_results: Whether to save results to session folder
+            
+        Yields:
+            Recognition results dictionary for each image, in order
+        """
+        if session_id is None:
+            session_id = str(uuid.uuid4())
+        
+        prefetched: queue.Queue = queue.Queue(maxsize=STREAM_PREFETCH_DEPTH)
+        stop = threading.Event()
+        end_of_stream = object()
+        
+        def put(item) -> bool:
+            # Block while the buffer is full, but give up once the consumer stops
+            while not stop.is_set():
+                try:
+                    prefetched.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+        
+        def prefetch():
+            try:
+                for path in image_paths:
+                    try:
+                        if preprocess:
+                            frame = self.image_processor.preprocess_image_array(path)
+                        else:
+                            frame = self.image_processor.load_image(path)
+                    except Exception as e:
+                        logger.error(f"Error prefetching {path}: {e}")
+                        frame = None
+                    
+                    if not put((path, frame)):
+                        return
+            finally:
+                put(end_of_stream)
+        
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            producer = executor.submit(prefetch)
+            try:
+                while True:
+                    item = prefetched.get()
+                    if item is end_of_stream:
+                        break
+                    
+                    path, frame = item
+                    yield self.recognize_faces(
+                        image_path=path,
+                        session_id=session_id,
+                        preprocess=False,
+                        save_results=save_results,
+                        image=frame
+                    )
+                
+                # Surface errors raised while iterating image_paths
+                producer.result()
+            finally:
+                stop.set()
+    
     def _save_session_results(self, session_id: str, results: Dict):
         """
         Save recognition results to session folder
@@ -277,15 +367,18 @@ class FaceRecognitionService:
             # Load existing results if file exists
             existing_results = []
             if results_file.exists():
-                with open(results_file, 'r') as f:
-                    existing_results = json.load(f)
+                with open(results_file, 'rb') as f:
+                    existing_results = orjson.loads(f.read())
             
             # Append new results
             existing_results.append(results)
             
             # Save updated results
-            with open(results_file, 'w') as f:
-                json.dump(existing_results, f, indent=2)
+            with open(results_file, 'wb') as f:
+                f.write(orjson.dumps(
+                    existing_results,
+                    option=orjson.OPT_APPEND_NEWLINE | orjson.OPT_SERIALIZE_NUMPY
+                ))
             
             logger.debug(f"Session results saved: {results_file}")
         
@@ -309,8 +402,8 @@ class FaceRecognitionService:
             if not results_file.exists():
                 return None
             
-            with open(results_file, 'r') as f:
-                return json.load(f)
+            with open(results_file, 'rb') as f:
+                return orjson.loads(f.read())
         
         except Exception as e:
             logger.error(f"Error getting session results: {e}")
@@ -4,10 +4,13 @@ Handles image preprocessing, optimization, and face extraction
 """
 
 import cv2
+import hashlib
+import io
+import threading
 import numpy as np
 from PIL import Image
-from pathlib import Path
-from typing import List, Dict, Optional, Tuple
+from collections import OrderedDict
+from typing import List, Dict, Optional, Tuple, Union
 import logging
 from deepface import DeepFace
 
@@ -15,6 +18,12 @@ from config.settings import settings
 
 logger = logging.getLogger(__name__)
 
+# Max number of preprocessed images kept in memory, keyed by content hash
+PREPROCESS_CACHE_SIZE = 64
+
+# Images needing less downscaling than this are left at their original size
+RESIZE_SKIP_SCALE = 0.95
+
 
 class ImageProcessor:
     """
@@ -28,13 +37,100 @@ class ImageProcessor:
         self.resize_height = settings.IMAGE_RESIZE_HEIGHT
         self.quality = settings.IMAGE_QUALITY
         self.detector_backend = settings.DEEPFACE_DETECTOR
+        self._preprocess_cache: "OrderedDict[bytes, np.ndarray]" = OrderedDict()
+        self._preprocess_cache_lock = threading.Lock()
         
         logger.info(f"ImageProcessor initialized: {self.resize_width}x{self.resize_height}, quality={self.quality}")
     
+    def load_image(self, image_path: str) -> Optional[np.ndarray]:
+        """
+        Decode an image from disk
+        
+        Args:
+            image_path: Path to image
+            
+        Returns:
+            BGR image array or None if it could not be read
+        """
+        return cv2.imread(image_path)
+    
+    def _target_size(self, original_width: int, original_height: int) -> Tuple[int, int]:
+        """
+        Calculate resize dimensions that keep the aspect ratio
+        Only ever downscales: small images are left as they are since the
+        detector handles its own scaling
+        
+        Args:
+            original_width: Source image width
+            original_height: Source image height
+            
+        Returns:
+            Tuple of (new_width, new_height), unchanged if no resize is needed
+        """
+        if original_width > original_height:  # Wider than tall
+            scale = self.resize_width / original_width
+        else:  # Taller than wide
+            scale = self.resize_height / original_height
+        
+        if scale >= RESIZE_SKIP_SCALE:
+            return original_width, original_height
+        
+        return max(1, int(original_width * scale)), max(1, int(original_height * scale))
+    
+    def preprocess_image_array(self, image_path: str) -> np.ndarray:
+        """
+        Preprocess image in memory for recognition
+        Same resize as preprocess_image, but without the JPEG round trip to disk.
+        Results are cached by content hash, so the same upload retried
+        skips decoding and resizing entirely
+        
+        Args:
+            image_path: Path to input image
+            
+        Returns:
+            Read-only BGR image array (shared with the cache, do not modify)
+        """
+        try:
+            with open(image_path, 'rb') as f:
+                image_bytes = f.read()
+            
+            digest = hashlib.blake2b(image_bytes, digest_size=16).digest()
+            
+            with self._preprocess_cache_lock:
+                cached = self._preprocess_cache.get(digest)
+                if cached is not None:
+                    self._preprocess_cache.move_to_end(digest)
+                    logger.debug(f"Preprocess cache hit: {image_path}")
+                    return cached
+            
+            img = Image.open(io.BytesIO(image_bytes))
+            if img.mode != 'RGB':
+                img = img.convert('RGB')
+            
+            original_width, original_height = img.size
+            new_width, new_height = self._target_size(original_width, original_height)
+            if (new_width, new_height) != (original_width, original_height):
+                img = img.resize((new_width, new_height), Image.Resampling.LANCZOS)
+            
+            array = cv2.cvtColor(np.asarray(img), cv2.COLOR_RGB2BGR)
+            array.flags.writeable = False
+            
+            with self._preprocess_cache_lock:
+                self._preprocess_cache[digest] = array
+                if len(self._preprocess_cache) > PREPROCESS_CACHE_SIZE:
+                    self._preprocess_cache.popitem(last=False)
+            
+            logger.debug(f"Image preprocessed in memory: {original_width}x{original_height} -> {new_width}x{new_height}")
+            return array
+        
+        except Exception as e:
+            logger.error(f"Error preprocessing image: {e}")
+            raise
+    
     def preprocess_image(self, image_path: str, output_path: Optional[str] = None) -> str:
         """
         Preprocess image for optimal recognition performance
-        - Resize to target dimensions (maintain aspect ratio)
+        - Downscale to target dimensions (maintain aspect ratio, never upsample)
         - Convert to RGB
         - Compress to JPEG at specified quality
         
@@ -55,19 +151,11 @@ class ImageProcessor:
             if img.mode != 'RGB':
                 img = img.convert('RGB')
             
-            # Calculate aspect ratio and resize
-            original_width, original_height = img.size
-            aspect_ratio = original_width / original_height
-            
-            if aspect_ratio > 1:  # Wider than tall
-                new_width = self.resize_width
-                new_height = int(new_width / aspect_ratio)
-            else:  # Taller than wide
-                new_height = self.resize_height
-                new_width = int(new_height * aspect_ratio)
-            
             # Resize image
-            img = img.resize((new_width, new_height), Image.Resampling.LANCZOS)
+            original_width, original_height = img.size
+            new_width, new_height = self._target_size(original_width, original_height)
+            if (new_width, new_height) != (original_width, original_height):
+                img = img.resize((new_width, new_height), Image.Resampling.LANCZOS)
             
             # Determine output path
             if output_path is None:
@@ -85,28 +173,31 @@ class ImageProcessor:
     
     def crop_face_region(
         self,
-        image_path: str,
+        image_path: Union[str, np.ndarray],
         face_region: Dict[str, int],
         padding: float = 0.1,
         output_path: Optional[str] = None
-    ) -> str:
+    ) -> np.ndarray:
         """
         Crop face region from image with optional padding
         
         Args:
-            image_path: Path to source image
+            image_path: Path to source image or already decoded BGR array
             face_region: Dictionary with 'x', 'y', 'width', 'height'
             padding: Percentage of padding to add (0.1 = 10%)
-            output_path: Path to save cropped face (if None, generates temp path)
+            output_path: Path to also save cropped face to (if None, nothing is written)
             
         Returns:
-            Path to cropped face image
+            Cropped face as a BGR array (a view into the source image)
         """
         try:
             # Load image
-            img = cv2.imread(image_path)
-            if img is None:
-                raise ValueError(f"Could not load image: {image_path}")
+            if isinstance(image_path, np.ndarray):
+                img = image_path
+            else:
+                img = cv2.imread(image_path)
+                if img is None:
+                    raise ValueError(f"Could not load image: {image_path}")
             
             h, w = img.shape[:2]
             
@@ -121,24 +212,21 @@ class ImageProcessor:
             pad_h = int(face_h * padding)
             
             # Apply padding with boundary checks
-            x1 = max(0, x - pad_w)
-            y1 = max(0, y - pad_h)
-            x2 = min(w, x + face_w + pad_w)
-            y2 = min(h, y + face_h + pad_h)
+            x1, y1, x2, y2 = np.clip(
+                [x - pad_w, y - pad_h, x + face_w + pad_w, y + face_h + pad_h],
+                0,
+                [w, h, w, h]
+            )
             
             # Crop face
             face_img = img[y1:y2, x1:x2]
             
-            # Generate output path if not provided
-            if output_path is None:
-                base_name = Path(image_path).stem
-                output_path = str(settings.TEMP_FOLDER / f"{base_name}_face.jpg")
-            
-            # Save cropped face
-            cv2.imwrite(output_path, face_img)
+            # Save cropped face if requested
+            if output_path is not None:
+                cv2.imwrite(output_path, face_img)
             
             logger.debug(f"Face cropped: ({x1},{y1}) to ({x2},{y2})")
-            return output_path
+            return face_img
         
         except Exception as e:
             logger.error(f"Error cropping face: {e}")
@@ -146,7 +234,7 @@ class ImageProcessor:
     
     def extract_faces_from_frame(
         self,
-        image_path: str,
+        image_path: Union[str, np.ndarray],
         min_confidence: float = 0.9
     ) -> List[Dict]:
         """
@@ -154,14 +242,15 @@ class ImageProcessor:
         Uses RetinaFace detector for better accuracy
         
         Args:
-            image_path: Path to input image
+            image_path: Path to input image or already decoded BGR array
             min_confidence: Minimum confidence threshold (0.0-1.0)
             
         Returns:
             List of face dictionaries with region and confidence
         """
         try:
-            logger.debug(f"Extracting faces from: {image_path}")
+            if isinstance(image_path, str):
+                logger.debug(f"Extracting faces from: {image_path}")
             
             # Use DeepFace for face detection
             faces = DeepFace.extract_faces(
@@ -4,15 +4,154 @@ Clean integration for cloud storage management
 """
 
 import os
+import asyncio
+import atexit
+import functools
+import hashlib
 import logging
-from supabase import create_client, Client
+import tarfile
+import tempfile
+import threading
+import time
+import aiofiles
+import aiofiles.os
+import httpx
+import orjson
+from cachetools import TTLCache
 from typing import Optional, Tuple, List, Dict
 from pathlib import Path
 
 from config.settings import settings
+from utils import validate_student_id
 
 logger = logging.getLogger(__name__)
 
+# Bucket folder holding student face images
+STUDENTS_PREFIX = "students/"
+
+# Sidecar file suffix recording the remote ETag of a synced image
+ETAG_SUFFIX = ".etag"
+
+# On-disk cache of the resolved students/ listing, in DATABASE_FOLDER
+STUDENTS_INDEX_FILE = ".supabase_index.json"
+
+# Optional per-class archive of student images, at <class_id>/<BUNDLE_NAME>
+BUNDLE_NAME = "faces.tar"
+BUNDLE_ETAG_FILE = ".bundle.etag"
+
+# Rows requested per page of the students/ tree listing; PostgREST may
+# cap pages lower (max-rows), so the total from Content-Range decides
+# when the listing is complete
+TREE_LISTING_PAGE_SIZE = 1000
+
+# PostgREST answers these when storage.objects is not exposed
+TREE_LISTING_UNSUPPORTED_STATUS = (404, 406)
+TREE_LISTING_UNSUPPORTED_CODES = ("PGRST106", "PGRST205", "42P01")
+
+# Concurrency levels tried by benchmark_sync
+SYNC_BENCHMARK_LEVELS = (1, 2, 4, 8, 16, 32, 64)
+
+# Chunk size for streaming file uploads and downloads
+STREAM_CHUNK_SIZE = 256 * 1024
+
+# Download attempts for timeouts, transport errors and 5xx responses,
+# backing off exponentially from DOWNLOAD_RETRY_BACKOFF seconds
+DOWNLOAD_ATTEMPTS = 3
+DOWNLOAD_RETRY_BACKOFF = 0.5
+
+# Cache-Control for uploads. Paths that are never overwritten may be cached
+# forever; any other path keeps Storage's default lifetime, because
+# get_public_url hands out the bare, unversioned URL
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+DEFAULT_CACHE_CONTROL = "max-age=3600"
+
+# Folder listings are reused for this many seconds
+LIST_CACHE_TTL = 30.0
+
+
+async def _iter_file_chunks(local_path: str, hasher=None):
+    """Yield a local file's contents in STREAM_CHUNK_SIZE chunks, feeding an optional hasher"""
+    async with aiofiles.open(local_path, 'rb') as f:
+        while chunk := await f.read(STREAM_CHUNK_SIZE):
+            if hasher is not None:
+                hasher.update(chunk)
+            yield chunk
+
+
+async def _read_etag(etag_path: str) -> Optional[str]:
+    """Read a stored ETag sidecar, or None if there is none"""
+    try:
+        async with aiofiles.open(etag_path, 'r') as f:
+            return (await f.read()).strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def _extract_bundle(tar_path: str, local_folder: Path) -> int:
+    """
+    Extract the images of a class bundle as <student_id>.jpg files
+    Member paths are never used as output paths: the student ID comes from
+    the member's folder ("<id>/<file>") or its file name ("<id>.jpg"), and
+    members in any other layout or with an invalid student ID are skipped
+    
+    Args:
+        tar_path: Downloaded tar archive
+        local_folder: Class folder to write images into
+        
+    Returns:
+        Number of students extracted (a student's later members replace earlier ones)
+    """
+    student_ids = set()
+    with tarfile.open(tar_path, mode='r|*') as archive:
+        for member in archive:
+            if not member.isfile() or not member.name.lower().endswith(('.jpg', '.jpeg', '.png')):
+                continue
+            
+            parts = [part for part in member.name.split('/') if part and part != '.']
+            if len(parts) == 1:
+                student_id = os.path.splitext(parts[0])[0]
+            elif len(parts) == 2:
+                student_id = parts[0]
+            else:
+                logger.warning(f"⚠️  Skipping bundle member in unexpected layout: {member.name}")
+                continue
+            
+            is_valid, _ = validate_student_id(student_id)
+            if not is_valid:
+                logger.warning(f"⚠️  Skipping bundle member with invalid student ID: {member.name}")
+                continue
+            
+            source = archive.extractfile(member)
+            if source is None:
+                continue
+            
+            local_path = local_folder / f"{student_id}.jpg"
+            part_path = f"{local_path}.part"
+            with open(part_path, 'wb') as f:
+                while chunk := source.read(STREAM_CHUNK_SIZE):
+                    f.write(chunk)
+            os.replace(part_path, local_path)
+            student_ids.add(student_id)
+    return len(student_ids)
+
+
+@functools.lru_cache(maxsize=8192)
+def _public_url(url: str, bucket: str, remote_path: str) -> str:
+    """Build the public object URL (a pure function of its inputs, so safe to memoize)"""
+    return f"{url}/storage/v1/object/public/{bucket}/{remote_path}"
+
+
+def _on_io_loop(method):
+    """Run an async service method on the service's I/O loop, whichever loop awaits it"""
+    @functools.wraps(method)
+    async def wrapper(self, *args, **kwargs):
+        loop = self._ensure_loop()
+        if asyncio.get_running_loop() is loop:
+            return await method(self, *args, **kwargs)
+        future = asyncio.run_coroutine_threadsafe(method(self, *args, **kwargs), loop)
+        return await asyncio.wrap_future(future)
+    return wrapper
+
 
 class SupabaseService:
     """
@@ -26,27 +165,107 @@ class SupabaseService:
         self.key = settings.SUPABASE_KEY
         self.bucket = settings.SUPABASE_BUCKET
         self.enabled = settings.SUPABASE_ENABLED
-        self.client: Optional[Client] = None
+        self.storage_url = f"{self.url}/storage/v1"
         
-        if self.enabled and self.url and self.key:
-            try:
-                self.client = create_client(self.url, self.key)
-                logger.info(f"✅ Supabase client initialized (bucket: {self.bucket})")
-            except Exception as e:
-                logger.error(f"❌ Failed to initialize Supabase: {e}")
-                self.enabled = False
+        # Pooled keep-alive HTTP client for the Storage API, owned by a
+        # background event loop so connections survive across requests
+        self._http: Optional[httpx.AsyncClient] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread: Optional[threading.Thread] = None
+        self._loop_lock = threading.Lock()
+        
+        # Folder -> listing, only touched from the I/O loop
+        self._list_cache: TTLCache = TTLCache(maxsize=1024, ttl=LIST_CACHE_TTL)
+        
+        # Max Storage requests in flight, shared by every sync on the I/O loop
+        self.sync_concurrency = max(1, settings.SUPABASE_SYNC_CONCURRENCY)
+        self._download_sem: Optional[asyncio.Semaphore] = None
+        
+        # Local directories already created, only touched from the I/O loop
+        self._known_dirs: set = set()
+        
+        # Whether storage.objects can be queried through PostgREST (None = untried)
+        self._tree_listing_supported: Optional[bool] = None
+        
+        if self.is_enabled():
+            atexit.register(self.close)
+            logger.info(f"✅ Supabase client initialized (bucket: {self.bucket})")
         else:
             logger.info("ℹ️  Supabase storage disabled or not configured")
     
     def is_enabled(self) -> bool:
         """Check if Supabase is enabled and configured"""
-        return self.enabled and self.client is not None
+        return bool(self.enabled and self.url and self.key)
+    
+    def _ensure_loop(self) -> asyncio.AbstractEventLoop:
+        """Start the background I/O loop on first use"""
+        with self._loop_lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                self._loop_thread = threading.Thread(
+                    target=self._loop.run_forever,
+                    name="supabase-io",
+                    daemon=True
+                )
+                self._loop_thread.start()
+            return self._loop
+    
+    def _run(self, coro):
+        """Run a coroutine on the I/O loop and wait for its result"""
+        loop = self._ensure_loop()
+        return asyncio.run_coroutine_threadsafe(coro, loop).result()
+    
+    def _get_http(self) -> httpx.AsyncClient:
+        """Get the pooled Storage API client (only call from the I/O loop)"""
+        if self._http is None:
+            self._http = httpx.AsyncClient(
+                base_url=self.storage_url,
+                headers={
+                    "apikey": self.key,
+                    "Authorization": f"Bearer {self.key}"
+                },
+                http2=True,
+                limits=httpx.Limits(
+                    max_connections=self.sync_concurrency * 4,
+                    max_keepalive_connections=self.sync_concurrency * 2,
+                    keepalive_expiry=300.0
+                ),
+                timeout=httpx.Timeout(30.0)
+            )
+        return self._http
+    
+    def _get_download_sem(self) -> asyncio.Semaphore:
+        """Get the shared sync semaphore (only call from the I/O loop)"""
+        if self._download_sem is None:
+            self._download_sem = asyncio.Semaphore(self.sync_concurrency)
+        return self._download_sem
+    
+    def close(self):
+        """Close pooled connections and stop the I/O loop"""
+        with self._loop_lock:
+            loop, self._loop = self._loop, None
+            thread, self._loop_thread = self._loop_thread, None
+        
+        if loop is None:
+            return
+        
+        try:
+            if self._http is not None:
+                asyncio.run_coroutine_threadsafe(self._http.aclose(), loop).result(timeout=5)
+                self._http = None
+        except Exception as e:
+            logger.warning(f"⚠️  Failed to close Supabase HTTP client: {e}")
+        finally:
+            loop.call_soon_threadsafe(loop.stop)
+            thread.join(timeout=5)
+            loop.close()
     
     def upload_file(
         self,
         local_path: str,
         remote_path: str,
-        content_type: str = "image/jpeg"
+        content_type: str = "image/jpeg",
+        immutable: bool = False
     ) -> Tuple[bool, Optional[str], Optional[str]]:
         """
         Upload a file to Supabase Storage
@@ -55,6 +274,7 @@ class SupabaseService:
             local_path: Path to local file
             remote_path: Destination path in bucket (e.g., "students/uuid.jpg")
             content_type: MIME type of file
+            immutable: remote_path is never overwritten, so caches may keep it forever
             
         Returns:
             Tuple of (success, public_url, error_message)
@@ -62,37 +282,7 @@ class SupabaseService:
         if not self.is_enabled():
             return False, None, "Supabase storage is not enabled"
         
-        try:
-            # Read file
-            with open(local_path, 'rb') as f:
-                file_data = f.read()
-            
-            # Delete existing file if present
-            try:
-                self.client.storage.from_(self.bucket).remove([remote_path])
-            except:
-                pass  # File doesn't exist, continue
-            
-            # Upload to Supabase
-            response = self.client.storage.from_(self.bucket).upload(
-                path=remote_path,
-                file=file_data,
-                file_options={
-                    "content-type": content_type,
-                    "upsert": "true"
-                }
-            )
-            
-            # Get public URL
-            public_url = self.get_public_url(remote_path)
-            
-            logger.info(f"✅ Uploaded to Supabase: {remote_path}")
-            return True, public_url, None
-        
-        except Exception as e:
-            error_msg = f"Failed to upload to Supabase: {str(e)}"
-            logger.error(f"❌ {error_msg}")
-            return False, None, error_msg
+        return self._run(self.upload_file_async(local_path, remote_path, content_type, immutable))
     
     def download_file(
         self,
@@ -112,25 +302,27 @@ class SupabaseService:
         if not self.is_enabled():
             return False, "Supabase storage is not enabled"
         
-        try:
-            # Download file
-            file_data = self.client.storage.from_(self.bucket).download(remote_path)
-            
-            if not file_data:
-                return False, f"File not found: {remote_path}"
-            
-            # Save to local path
-            Path(local_path).parent.mkdir(parents=True, exist_ok=True)
-            with open(local_path, 'wb') as f:
-                f.write(file_data)
+        return self._run(self.download_file_async(remote_path, local_path))
+    
+    def upload_many(
+        self,
+        items: List[Tuple[str, str]],
+        content_type: str = "image/jpeg"
+    ) -> List[Tuple[bool, Optional[str], Optional[str]]]:
+        """
+        Upload several files to Supabase Storage concurrently
+        
+        Args:
+            items: (local_path, remote_path) pairs
+            content_type: MIME type of the files
             
-            logger.info(f"✅ Downloaded from Supabase: {remote_path} -> {local_path}")
-            return True, None
+        Returns:
+            List of (success, public_url, error_message), one per item
+        """
+        if not self.is_enabled():
+            return [(False, None, "Supabase storage is not enabled")] * len(items)
         
-        except Exception as e:
-            error_msg = f"Failed to download from Supabase: {str(e)}"
-            logger.error(f"❌ {error_msg}")
-            return False, error_msg
+        return self._run(self.upload_many_async(items, content_type))
     
     def delete_file(self, remote_path: str) -> Tuple[bool, Optional[str]]:
         """
@@ -139,15 +331,30 @@ class SupabaseService:
         Args:
             remote_path: Path to file in bucket
             
+        Returns:
+            Tuple of (success, error_message)
+        """
+        return self.remove_many([remote_path])
+    
+    def remove_many(self, remote_paths: List[str]) -> Tuple[bool, Optional[str]]:
+        """
+        Delete several files from Supabase Storage in a single request
+        
+        Args:
+            remote_paths: Paths to files in bucket
+            
         Returns:
             Tuple of (success, error_message)
         """
         if not self.is_enabled():
             return False, "Supabase storage is not enabled"
         
+        if not remote_paths:
+            return True, None
+        
         try:
-            self.client.storage.from_(self.bucket).remove([remote_path])
-            logger.info(f"✅ Deleted from Supabase: {remote_path}")
+            self._run(self._remove_async(remote_paths))
+            logger.info(f"✅ Deleted from Supabase: {', '.join(remote_paths)}")
             return True, None
         
         except Exception as e:
@@ -168,12 +375,7 @@ class SupabaseService:
         if not self.is_enabled():
             return ""
         
-        try:
-            public_url = self.client.storage.from_(self.bucket).get_public_url(remote_path)
-            return public_url
-        except Exception as e:
-            logger.error(f"❌ Failed to get public URL: {e}")
-            return ""
+        return _public_url(self.url, self.bucket, remote_path)
     
     def list_files(self, folder: str = "") -> List[Dict]:
         """
@@ -189,9 +391,8 @@ class SupabaseService:
             return []
         
         try:
-            files = self.client.storage.from_(self.bucket).list(folder)
-            return files
-        except Exception as e:
+            return self._run(self._list_files_async(folder))
+        except (httpx.HTTPError, OSError) as e:
             logger.error(f"❌ Failed to list files: {e}")
             return []
     
@@ -220,13 +421,15 @@ class SupabaseService:
             logger.error(error_msg)
             raise Exception(error_msg)
         
-        remote_path = f"students/{student_id}/{filename}"
+        remote_path = f"{STUDENTS_PREFIX}{student_id}/{filename}"
         
         logger.info(f"📤 Uploading student face to Supabase: {remote_path}")
+        # Face filenames carry their upload timestamp, so each path is written once
         success, public_url, error = self.upload_file(
             local_path=local_path,
             remote_path=remote_path,
-            content_type="image/jpeg"
+            content_type="image/jpeg",
+            immutable=True
         )
         
         if success and public_url:
@@ -237,10 +440,399 @@ class SupabaseService:
             logger.error(error_msg)
             raise Exception(error_msg)
     
+    @_on_io_loop
+    async def upload_file_async(
+        self,
+        local_path: str,
+        remote_path: str,
+        content_type: str = "image/jpeg",
+        immutable: bool = False
+    ) -> Tuple[bool, Optional[str], Optional[str]]:
+        """
+        Upload a file through the Storage REST API
+        The file is streamed from disk in chunks instead of read into memory
+        
+        Args:
+            local_path: Path to local file
+            remote_path: Destination path in bucket
+            content_type: MIME type of file
+            immutable: remote_path is never overwritten, so caches may keep it forever
+            
+        Returns:
+            Tuple of (success, public_url, error_message)
+        """
+        if not self.is_enabled():
+            return False, None, "Supabase storage is not enabled"
+        
+        try:
+            file_size = (await aiofiles.os.stat(local_path)).st_size
+            
+            # Upload to Supabase (x-upsert replaces any existing file),
+            # hashing the content on the way for the URL version
+            hasher = hashlib.blake2b(digest_size=8)
+            response = await self._get_http().post(
+                f"/object/{self.bucket}/{remote_path}",
+                content=_iter_file_chunks(local_path, hasher),
+                headers={
+                    "content-type": content_type,
+                    "content-length": str(file_size),
+                    "cache-control": IMMUTABLE_CACHE_CONTROL if immutable else DEFAULT_CACHE_CONTROL,
+                    "x-upsert": "true"
+                }
+            )
+            response.raise_for_status()
+            
+            # Get public URL, versioned so CDNs never serve a replaced file
+            public_url = f"{self.get_public_url(remote_path)}?v={hasher.hexdigest()}"
+            
+            self._invalidate_listings(remote_path)
+            
+            logger.info(f"✅ Uploaded to Supabase: {remote_path}")
+            return True, public_url, None
+        
+        except (httpx.HTTPError, OSError) as e:
+            error_msg = f"Failed to upload to Supabase: {str(e)}"
+            logger.error(f"❌ {error_msg}")
+            return False, None, error_msg
+    
+    @_on_io_loop
+    async def upload_many_async(
+        self,
+        items: List[Tuple[str, str]],
+        content_type: str = "image/jpeg"
+    ) -> List[Tuple[bool, Optional[str], Optional[str]]]:
+        """
+        Upload several files concurrently over the pooled client
+        Each file is a single streamed POST, with at most sync_concurrency
+        uploads in flight
+        
+        Args:
+            items: (local_path, remote_path) pairs
+            content_type: MIME type of the files
+            
+        Returns:
+            List of (success, public_url, error_message), one per item
+        """
+        semaphore = asyncio.Semaphore(self.sync_concurrency)
+        
+        async def upload_one(local_path: str, remote_path: str):
+            async with semaphore:
+                return await self.upload_file_async(local_path, remote_path, content_type)
+        
+        results = await asyncio.gather(
+            *[upload_one(local_path, remote_path) for local_path, remote_path in items]
+        )
+        
+        uploaded = sum(1 for success, _, _ in results if success)
+        logger.info(f"✅ Uploaded {uploaded}/{len(items)} files to Supabase")
+        return list(results)
+    
+    async def _remove_async(self, paths: List[str]) -> List[Dict]:
+        """
+        Delete files through the Storage REST API
+        
+        Args:
+            paths: Paths to files in bucket
+            
+        Returns:
+            List of deleted file objects
+        """
+        response = await self._get_http().request(
+            "DELETE",
+            f"/object/{self.bucket}",
+            json={"prefixes": paths}
+        )
+        response.raise_for_status()
+        
+        for path in paths:
+            self._invalidate_listings(path)
+        return response.json()
+    
+    def _invalidate_listings(self, remote_path: str):
+        """
+        Drop cached listings of every folder containing a path
+        
+        Args:
+            remote_path: Path to a file in bucket that was added or removed
+        """
+        if remote_path.startswith(STUDENTS_PREFIX):
+            self._drop_students_index()
+        
+        parts = remote_path.split('/')[:-1]
+        self._list_cache.pop("", None)
+        for depth in range(1, len(parts) + 1):
+            folder = '/'.join(parts[:depth])
+            self._list_cache.pop(folder, None)
+            self._list_cache.pop(folder + '/', None)
+    
+    def _students_index_path(self) -> Path:
+        """Path of the on-disk students/ index"""
+        return settings.DATABASE_FOLDER / STUDENTS_INDEX_FILE
+    
+    def _load_students_index(self) -> Optional[Tuple[Dict[str, List[Dict]], List[Dict]]]:
+        """
+        Load the cached students/ listing if it is younger than SUPABASE_INDEX_TTL
+        
+        Returns:
+            Tuple of (student_id -> files in its folder, root-level files),
+            or None if there is no fresh index
+        """
+        if settings.SUPABASE_INDEX_TTL <= 0:
+            return None
+        
+        try:
+            with open(self._students_index_path(), 'rb') as f:
+                index = orjson.loads(f.read())
+        except (OSError, orjson.JSONDecodeError):
+            return None
+        
+        if time.time() - index.get('ts', 0) >= settings.SUPABASE_INDEX_TTL:
+            return None
+        
+        return index['folders'], index['root']
+    
+    def _save_students_index(self, student_folders: Dict[str, List[Dict]], root_files: List[Dict]):
+        """
+        Persist a complete students/ listing for later syncs
+        
+        Args:
+            student_folders: student_id -> files in its folder
+            root_files: Root-level files
+        """
+        if settings.SUPABASE_INDEX_TTL <= 0:
+            return
+        
+        index_path = self._students_index_path()
+        tmp_path = f"{index_path}.part"
+        try:
+            index_path.parent.mkdir(parents=True, exist_ok=True)
+            with open(tmp_path, 'wb') as f:
+                f.write(orjson.dumps({'ts': time.time(), 'folders': student_folders, 'root': root_files}))
+            os.replace(tmp_path, index_path)
+        except OSError as e:
+            logger.warning(f"⚠️  Could not save students index: {e}")
+    
+    def _drop_students_index(self):
+        """Delete the on-disk students/ index"""
+        try:
+            os.remove(self._students_index_path())
+        except FileNotFoundError:
+            pass
+    
+    async def _list_students_tree_async(self) -> Optional[Tuple[Dict[str, List[Dict]], List[Dict]]]:
+        """
+        List everything under students/ with paged PostgREST queries on storage.objects
+        Needs the storage schema to be exposed; otherwise this is remembered
+        and None is returned so callers fall back to per-folder listing.
+        Any other failure, or a listing shorter than its reported total, also
+        returns None so an incomplete tree is never synced or cached
+        
+        Returns:
+            Tuple of (student_id -> files in its folder, root-level files),
+            in listing format, or None if the query is unavailable
+        """
+        if self._tree_listing_supported is False:
+            return None
+        
+        rows: List[Dict] = []
+        while True:
+            try:
+                response = await self._get_http().get(
+                    f"{self.url}/rest/v1/objects",
+                    params={
+                        "select": "name,metadata",
+                        "bucket_id": f"eq.{self.bucket}",
+                        "name": f"like.{STUDENTS_PREFIX}*",
+                        "order": "name.asc",
+                        "offset": str(len(rows)),
+                        "limit": str(TREE_LISTING_PAGE_SIZE)
+                    },
+                    headers={"accept-profile": "storage", "prefer": "count=exact"}
+                )
+            except httpx.HTTPError as e:
+                logger.warning(f"⚠️  Tree listing failed, listing folders instead: {e}")
+                return None
+            
+            if response.is_error:
+                if self._is_schema_unavailable(response):
+                    self._tree_listing_supported = False
+                    logger.info("ℹ️  storage.objects is not exposed, listing student folders one by one")
+                else:
+                    logger.warning(f"⚠️  Tree listing failed ({response.status_code}), listing folders instead")
+                return None
+            
+            page = response.json()
+            rows.extend(page)
+            
+            # Content-Range is "<first>-<last>/<total>" (total "*" if unknown)
+            total = response.headers.get("content-range", "").rpartition('/')[2]
+            if total.isdigit():
+                if len(rows) >= int(total):
+                    break
+                if not page:
+                    logger.warning("⚠️  Tree listing ended early, listing folders instead")
+                    return None
+            elif len(page) < TREE_LISTING_PAGE_SIZE:
+                break
+        
+        self._tree_listing_supported = True
+        
+        student_folders: Dict[str, List[Dict]] = {}
+        root_files: List[Dict] = []
+        for row in rows:
+            parts = row['name'][len(STUDENTS_PREFIX):].split('/')
+            entry = {'name': parts[-1], 'metadata': row.get('metadata')}
+            if len(parts) == 1:
+                root_files.append(entry)
+            elif len(parts) == 2:
+                student_folders.setdefault(parts[0], []).append(entry)
+        
+        return student_folders, root_files
+    
+    @staticmethod
+    def _is_schema_unavailable(response: httpx.Response) -> bool:
+        """Whether a PostgREST error means storage.objects is not exposed at all"""
+        if response.status_code in TREE_LISTING_UNSUPPORTED_STATUS:
+            return True
+        try:
+            return response.json().get("code") in TREE_LISTING_UNSUPPORTED_CODES
+        except (ValueError, AttributeError):
+            return False
+    
+    async def _list_files_async(self, folder: str) -> List[Dict]:
+        """
+        List files in a folder through the Storage REST API
+        
+        Args:
+            folder: Folder path in bucket
+            
+        Returns:
+            List of file objects
+        """
+        cached = self._list_cache.get(folder)
+        if cached is not None:
+            return cached
+        
+        response = await self._get_http().post(
+            f"/object/list/{self.bucket}",
+            json={
+                "prefix": folder,
+                "limit": 100,
+                "offset": 0,
+                "sortBy": {"column": "name", "order": "asc"}
+            }
+        )
+        response.raise_for_status()
+        
+        files = response.json()
+        self._list_cache[folder] = files
+        return files
+    
+    @_on_io_loop
+    async def download_file_async(
+        self,
+        remote_path: str,
+        local_path: str,
+        etag_path: Optional[str] = None
+    ) -> Tuple[bool, Optional[str]]:
+        """
+        Download a file through the Storage REST API
+        The response body is streamed to disk in chunks instead of held in memory
+        
+        Args:
+            remote_path: Path to file in bucket
+            local_path: Local destination path
+            etag_path: Optional ETag sidecar; when given, the download is a
+                conditional GET and an unchanged local file is kept as is
+            
+        Returns:
+            Tuple of (success, error_message)
+        """
+        if not self.is_enabled():
+            return False, "Supabase storage is not enabled"
+        
+        headers = {}
+        if etag_path and os.path.exists(local_path):
+            cached_etag = await _read_etag(etag_path)
+            if cached_etag:
+                headers["if-none-match"] = cached_etag
+        
+        # Stream into a sibling temp file and rename it into place, so readers
+        # never see a partially written image
+        part_path = f"{local_path}.part"
+        recreated_dir = False
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                async with self._get_http().stream(
+                    "GET", f"/object/{self.bucket}/{remote_path}", headers=headers
+                ) as response:
+                    if response.status_code == 304:
+                        return True, None
+                    
+                    # Storage reports a missing object as 400 or 404
+                    if response.status_code in (400, 404):
+                        return False, f"File not found: {remote_path}"
+                    response.raise_for_status()
+                    
+                    # Save to local path
+                    parent = os.path.dirname(local_path)
+                    if parent not in self._known_dirs:
+                        os.makedirs(parent or '.', exist_ok=True)
+                        self._known_dirs.add(parent)
+                    bytes_written = 0
+                    async with aiofiles.open(part_path, 'wb') as f:
+                        async for chunk in response.aiter_bytes(STREAM_CHUNK_SIZE):
+                            await f.write(chunk)
+                            bytes_written += len(chunk)
+                
+                if not bytes_written:
+                    await aiofiles.os.remove(part_path)
+                    return False, f"File not found: {remote_path}"
+                
+                await aiofiles.os.replace(part_path, local_path)
+                
+                remote_etag = response.headers.get("etag")
+                if etag_path and remote_etag:
+                    async with aiofiles.open(etag_path, 'w') as f:
+                        await f.write(remote_etag)
+                
+                logger.debug(f"Downloaded from Supabase: {remote_path} -> {local_path}")
+                return True, None
+            
+            except (httpx.HTTPError, OSError) as e:
+                if os.path.exists(part_path):
+                    os.remove(part_path)
+                # The folder may have been removed since it was created;
+                # forget it and retry once so the next attempt recreates it
+                self._known_dirs.discard(os.path.dirname(local_path))
+                if isinstance(e, FileNotFoundError) and not recreated_dir:
+                    recreated_dir = True
+                    attempt -= 1  # Not a remote failure, so it does not use up an attempt
+                    logger.warning(f"⚠️  Local folder for {local_path} is gone, recreating it")
+                    continue
+                
+                # Only timeouts, dropped connections and 5xx are worth retrying
+                retryable = isinstance(e, httpx.TransportError) or (
+                    isinstance(e, httpx.HTTPStatusError) and e.response.status_code >= 500
+                )
+                if retryable and attempt < DOWNLOAD_ATTEMPTS:
+                    delay = DOWNLOAD_RETRY_BACKOFF * 2 ** (attempt - 1)
+                    logger.warning(f"⚠️  Download of {remote_path} failed ({e}), retrying in {delay:.1f}s")
+                    await asyncio.sleep(delay)
+                    continue
+                
+                error_msg = f"Failed to download from Supabase: {str(e)}"
+                logger.error(f"❌ {error_msg}")
+                return False, error_msg
+    
     def sync_class_students(
         self,
         class_id: str,
-        local_folder: Path
+        local_folder: Path,
+        force: bool = False,
+        use_index: bool = True
     ) -> Tuple[int, str]:
         """
         Sync class database from Supabase to local storage
@@ -249,6 +841,230 @@ class SupabaseService:
         Args:
             class_id: Class identifier
             local_folder: Local folder to save images
+            force: Re-download every image, even ones already up to date
+            use_index: Reuse a fresh on-disk students/ listing instead of listing again
+            
+        Returns:
+            Tuple of (student_count, message)
+        """
+        return self._run(self.sync_class_students_async(
+            class_id, local_folder, force=force, use_index=use_index
+        ))
+    
+    def sync_classes(
+        self,
+        class_folders: Dict[str, Path],
+        force: bool = False
+    ) -> Dict[str, Tuple[int, str]]:
+        """
+        Sync several class databases from Supabase at once
+        All classes share one event loop and the sync semaphore, so one
+        class's listing overlaps with another's downloads
+        
+        Args:
+            class_folders: class_id -> local folder to save images
+            force: Re-download every image, even ones already up to date
+            
+        Returns:
+            class_id -> (student_count, message)
+        """
+        return self._run(self.sync_classes_async(class_folders, force=force))
+    
+    @_on_io_loop
+    async def sync_classes_async(
+        self,
+        class_folders: Dict[str, Path],
+        force: bool = False
+    ) -> Dict[str, Tuple[int, str]]:
+        """
+        Sync several class databases from Supabase concurrently
+        
+        Args:
+            class_folders: class_id -> local folder to save images
+            force: Re-download every image, even ones already up to date
+            
+        Returns:
+            class_id -> (student_count, message)
+        """
+        results = await asyncio.gather(*[
+            self.sync_class_students_async(class_id, local_folder, force=force)
+            for class_id, local_folder in class_folders.items()
+        ])
+        return dict(zip(class_folders, results))
+    
+    def sync_class_bundle(
+        self,
+        class_id: str,
+        local_folder: Path,
+        force: bool = False,
+        use_index: bool = True
+    ) -> Tuple[int, str]:
+        """
+        Sync class database from a single <class_id>/faces.tar archive
+        Falls back to per-student sync when the class has no bundle
+        
+        Args:
+            class_id: Class identifier
+            local_folder: Local folder to save images
+            force: Re-download even if the bundle is unchanged
+            use_index: For the per-student fallback, reuse a fresh on-disk listing
+            
+        Returns:
+            Tuple of (student_count, message)
+        """
+        return self._run(self.sync_class_bundle_async(
+            class_id, local_folder, force=force, use_index=use_index
+        ))
+    
+    @_on_io_loop
+    async def sync_class_bundle_async(
+        self,
+        class_id: str,
+        local_folder: Path,
+        force: bool = False,
+        use_index: bool = True
+    ) -> Tuple[int, str]:
+        """
+        Sync class database from a single <class_id>/faces.tar archive
+        The bundle is fetched with a conditional GET and streamed to disk
+        before extraction; a missing bundle falls back to per-student sync
+        
+        Args:
+            class_id: Class identifier
+            local_folder: Local folder to save images
+            force: Re-download even if the bundle is unchanged
+            use_index: For the per-student fallback, reuse a fresh on-disk listing
+            
+        Returns:
+            Tuple of (student_count, message)
+        """
+        if not self.is_enabled():
+            return 0, "Supabase not enabled"
+        
+        local_folder.mkdir(parents=True, exist_ok=True)
+        self._known_dirs.add(str(local_folder))
+        etag_path = str(local_folder / BUNDLE_ETAG_FILE)
+        tar_path = str(local_folder / f"{BUNDLE_NAME}.part")
+        
+        headers = {}
+        if not force:
+            cached_etag = await _read_etag(etag_path)
+            if cached_etag:
+                headers["if-none-match"] = cached_etag
+        
+        try:
+            bundle_missing = False
+            async with self._get_http().stream(
+                "GET", f"/object/{self.bucket}/{class_id}/{BUNDLE_NAME}", headers=headers
+            ) as response:
+                if response.status_code == 304:
+                    with os.scandir(local_folder) as entries:
+                        student_count = sum(1 for entry in entries if entry.name.endswith('.jpg'))
+                    return student_count, "Class bundle unchanged"
+                
+                # Storage reports a missing object as 400 or 404
+                if response.status_code in (400, 404):
+                    bundle_missing = True
+                else:
+                    response.raise_for_status()
+                    remote_etag = response.headers.get("etag")
+                    
+                    async with aiofiles.open(tar_path, 'wb') as f:
+                        async for chunk in response.aiter_bytes(STREAM_CHUNK_SIZE):
+                            await f.write(chunk)
+            
+            # Fall back once the bundle response is closed, so it does not
+            # hold a connection for the whole per-student sync
+            if bundle_missing:
+                logger.info(f"ℹ️  No bundle for class {class_id}, syncing students one by one")
+                return await self.sync_class_students_async(
+                    class_id, local_folder, force=force, use_index=use_index
+                )
+            
+            student_count = await asyncio.to_thread(_extract_bundle, tar_path, local_folder)
+            
+            if remote_etag:
+                async with aiofiles.open(etag_path, 'w') as f:
+                    await f.write(remote_etag)
+            
+            message = f"Synced {student_count} students from class bundle"
+            logger.info(f"  ✅ {message}")
+            return student_count, message
+        
+        except (httpx.HTTPError, OSError, tarfile.TarError) as e:
+            error_msg = f"Bundle sync error: {str(e)}"
+            logger.error(f"❌ {error_msg}")
+            return 0, error_msg
+        
+        finally:
+            if os.path.exists(tar_path):
+                os.remove(tar_path)
+    
+    def benchmark_sync(self, class_id: str) -> int:
+        """
+        Time a full class sync at each level in SYNC_BENCHMARK_LEVELS and
+        keep the fastest as the sync concurrency
+        Each run downloads into a fresh temporary folder
+        
+        Args:
+            class_id: Class identifier to sync
+            
+        Returns:
+            Chosen concurrency level
+        """
+        if not self.is_enabled():
+            return self.sync_concurrency
+        
+        timings = {}
+        for level in SYNC_BENCHMARK_LEVELS:
+            self._run(self._reset_sync_state_async())
+            with tempfile.TemporaryDirectory() as tmp_dir:
+                start = time.perf_counter()
+                self._run(self.sync_class_students_async(
+                    class_id, Path(tmp_dir), concurrency=level, use_index=False
+                ))
+                timings[level] = time.perf_counter() - start
+            logger.info(f"  ⏱️  concurrency={level}: {timings[level]:.2f}s")
+        
+        best = min(timings, key=timings.get)
+        self._run(self._reset_sync_state_async(best))
+        logger.info(f"✅ Sync concurrency set to {best}")
+        return best
+    
+    async def _reset_sync_state_async(self, concurrency: Optional[int] = None):
+        """
+        Drop cached listings and optionally switch the shared sync concurrency
+        Runs on the I/O loop, which owns the listing cache and the semaphore
+        
+        Args:
+            concurrency: New sync_concurrency, or None to keep the current one
+        """
+        self._list_cache.clear()
+        if concurrency is not None:
+            self.sync_concurrency = concurrency
+            self._download_sem = asyncio.Semaphore(concurrency)
+    
+    @_on_io_loop
+    async def sync_class_students_async(
+        self,
+        class_id: str,
+        local_folder: Path,
+        concurrency: Optional[int] = None,
+        force: bool = False,
+        use_index: bool = True
+    ) -> Tuple[int, str]:
+        """
+        Sync class database from Supabase to local storage
+        Student folders are listed and downloaded concurrently over the
+        pooled connection, with at most sync_concurrency requests in flight
+        across all running syncs
+        
+        Args:
+            class_id: Class identifier
+            local_folder: Local folder to save images
+            concurrency: Private request limit for this sync, instead of the shared one
+            force: Re-download every image, even ones already up to date
+            use_index: Reuse a fresh on-disk students/ listing instead of listing again
             
         Returns:
             Tuple of (student_count, message)
@@ -261,77 +1077,143 @@ class SupabaseService:
             
             # Create class folder
             local_folder.mkdir(parents=True, exist_ok=True)
+            self._known_dirs.add(str(local_folder))
+            
+            # Reuse a fresh on-disk listing, else list the whole students/
+            # tree in one query when possible, otherwise only its top level
+            tree = self._load_students_index() if use_index and not force else None
+            from_index = tree is not None
+            if tree is None:
+                tree = await self._list_students_tree_async()
+            if tree is not None:
+                student_folders, items = tree
+            else:
+                student_folders = None
+                items = await self._list_files_async(STUDENTS_PREFIX)
             
-            # List all entries in students/
-            items = self.list_files("students/")
+            # Folder listings gathered during this sync, for the on-disk index
+            listed_folders: Dict[str, List[Dict]] = {}
             
             IMAGE_EXTS = ('.jpg', '.jpeg', '.png')
             
-            # Separate folder-style and root-level images
-            folder_student_ids = [
-                item.get('name', '') for item in items
-                if item.get('name') and not item.get('name', '').lower().endswith(IMAGE_EXTS)
-                and '.' not in item.get('name', '')
-            ]
+            # Separate folder-style and root-level images in one pass
+            folder_student_ids = list(student_folders) if student_folders is not None else []
+            root_images = []
+            for item in items:
+                name = item.get('name') or ''
+                if name.lower().endswith(IMAGE_EXTS):
+                    root_images.append((name, (item.get('metadata') or {}).get('eTag')))
+                elif name and '.' not in name:
+                    folder_student_ids.append(name)
             
-            root_images = [
-                item.get('name', '') for item in items
-                if item.get('name', '').lower().endswith(IMAGE_EXTS)
+            # One download per student: a folder image, a root image and any
+            # same-named root images all map to <id>.jpg (and its .part and
+            # .etag files). As in a one-by-one sync, the last root image wins
+            root_by_student: Dict[str, Tuple[str, Optional[str]]] = {}
+            for filename, remote_etag in root_images:
+                student_id = os.path.splitext(os.path.basename(filename))[0]
+                root_by_student[student_id] = (filename, remote_etag)
+            folder_student_ids = [
+                student_id for student_id in dict.fromkeys(folder_student_ids)
+                if student_id not in root_by_student
             ]
             
-            if not folder_student_ids and not root_images:
+            if not folder_student_ids and not root_by_student:
                 return 0, "No students found in Supabase"
             
-            logger.info(f"  Found {len(folder_student_ids)} student folders and {len(root_images)} root images")
+            logger.info(f"  Found {len(folder_student_ids)} student folders and {len(root_by_student)} root images")
             
-            success_count = 0
+            semaphore = asyncio.Semaphore(concurrency) if concurrency else self._get_download_sem()
+            
+            async def fetch_image(remote_path: str, student_id: str, remote_etag: Optional[str]) -> Tuple[bool, bool]:
+                """Download one student image unless the local copy is already current"""
+                # Save directly in class folder with student ID as filename
+                local_path = str(local_folder / f"{student_id}.jpg")
+                etag_path = str(local_folder / f"{student_id}{ETAG_SUFFIX}")
+                
+                if force:
+                    # Drop the cached ETag so the download is unconditional
+                    if os.path.exists(etag_path):
+                        await aiofiles.os.remove(etag_path)
+                elif os.path.exists(local_path):
+                    # Without a remote ETag, an existing file is the best signal
+                    if remote_etag is None or await _read_etag(etag_path) == remote_etag:
+                        return True, False
+                
+                async with semaphore:
+                    success, error = await self.download_file_async(remote_path, local_path, etag_path)
+                return success, success
             
-            # Download from student folders
-            for student_id in folder_student_ids:
+            async def sync_folder_student(student_id: str) -> bool:
                 try:
-                    student_files = self.list_files(f"students/{student_id}/")
+                    if student_folders is not None:
+                        student_files = student_folders[student_id]
+                    else:
+                        async with semaphore:
+                            student_files = await self._list_files_async(f"{STUDENTS_PREFIX}{student_id}/")
+                        listed_folders[student_id] = student_files
+                    
                     image_files = [
                         f for f in student_files
                         if f.get('name', '').lower().endswith(IMAGE_EXTS)
                     ]
                     
                     if not image_files:
-                        continue
+                        return False
                     
                     # Download first image
-                    image_file = image_files[0]['name']
-                    remote_path = f"students/{student_id}/{image_file}"
-                    
-                    # Save directly in class folder with student ID as filename
-                    local_path = str(local_folder / f"{student_id}.jpg")
+                    image_file = image_files[0]
+                    remote_path = f"{STUDENTS_PREFIX}{student_id}/{image_file['name']}"
+                    remote_etag = (image_file.get('metadata') or {}).get('eTag')
                     
-                    success, error = self.download_file(remote_path, local_path)
-                    if success:
-                        success_count += 1
+                    success, downloaded = await fetch_image(remote_path, student_id, remote_etag)
+                    if downloaded:
                         logger.info(f"  ✅ Downloaded {student_id}.jpg")
+                    return success
                 
                 except Exception as e:
                     logger.error(f"  ❌ Error downloading student {student_id}: {e}")
+                    return False
             
-            # Download root images
-            for filename in root_images:
+            async def sync_root_image(student_id: str, filename: str, remote_etag: Optional[str]) -> bool:
                 try:
-                    base = os.path.basename(filename)
-                    name_wo_ext, _ = os.path.splitext(base)
-                    # Use the full filename (without extension) as student_id - it should be a GUID
-                    student_id = name_wo_ext
+                    # student_id is the full filename without extension - it should be a GUID
+                    remote_path = f"{STUDENTS_PREFIX}{filename}"
                     
-                    remote_path = f"students/{filename}"
-                    # Save directly in class folder with student ID as filename
-                    local_path = str(local_folder / f"{student_id}.jpg")
-                    
-                    success, error = self.download_file(remote_path, local_path)
-                    if success:
-                        success_count += 1
+                    success, downloaded = await fetch_image(remote_path, student_id, remote_etag)
+                    if downloaded:
                         logger.info(f"  ✅ Downloaded {student_id}.jpg from root")
+                    return success
                 
                 except Exception as e:
                     logger.error(f"  ❌ Error downloading root image {filename}: {e}")
+                    return False
+            
+            results = await asyncio.gather(
+                *[sync_folder_student(student_id) for student_id in folder_student_ids],
+                *[
+                    sync_root_image(student_id, filename, remote_etag)
+                    for student_id, (filename, remote_etag) in root_by_student.items()
+                ],
+                return_exceptions=True
+            )
+            
+            success_count = sum(1 for result in results if result is True)
+            
+            # A cached listing that led to failed downloads may be stale
+            if from_index and success_count < len(results):
+                self._drop_students_index()
+            
+            # Only a complete listing is worth caching
+            if not from_index:
+                root_files = [
+                    item for item in items
+                    if (item.get('name') or '').lower().endswith(IMAGE_EXTS)
+                ]
+                if student_folders is not None:
+                    self._save_students_index(student_folders, root_files)
+                elif len(listed_folders) == len(folder_student_ids):
+                    self._save_students_index(listed_folders, root_files)
             
             message = f"Synced {success_count} students from Supabase"
             logger.info(f"  ✅ {message}")
@@ -341,3 +1223,15 @@ class SupabaseService:
             error_msg = f"Sync error: {str(e)}"
             logger.error(f"❌ {error_msg}")
             return 0, error_msg
+
+
+@functools.lru_cache(maxsize=None)
+def get_supabase() -> SupabaseService:
+    """
+    Get the process-wide Supabase service
+    
+    Returns:
+        Shared SupabaseService instance (one client, one connection pool)
+    """
+    return SupabaseService()
+
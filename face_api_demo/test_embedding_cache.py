@@ -0,0 +1,81 @@
+"""
+Tests for the embedding cache's matching gallery
+Run with: pytest test_embedding_cache.py
+"""
+
+import sys
+from pathlib import Path
+
+import numpy as np
+
+# Add parent directory to path
+sys.path.insert(0, str(Path(__file__).parent))
+
+from services.embedding_cache import EmbeddingCache
+
+
+def _unit(index: int) -> np.ndarray:
+    embedding = np.zeros(512, dtype=np.float32)
+    embedding[index] = 1.0
+    return embedding
+
+
+class _InterleavingDict(dict):
+    """Runs a callback right after the gallery rebuild snapshots the cache"""
+
+    def __init__(self, *args, on_snapshot=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.on_snapshot = on_snapshot
+
+    def items(self):
+        snapshot = list(super().items())
+        callback, self.on_snapshot = self.on_snapshot, None
+        if callback is not None:
+            callback()
+        return snapshot
+
+
+def _make_cache() -> EmbeddingCache:
+    cache = EmbeddingCache(preload=False)
+    cache.distance_metric = 'cosine'
+    return cache
+
+
+def test_gallery_follows_set_embedding():
+    cache = _make_cache()
+    cache.set_embedding("s1", _unit(0), save_to_disk=False)
+    assert cache.find_best_matches_batch(_unit(0)[None, :], threshold=0.4)[0][0] == "s1"
+
+    cache.set_embedding("s2", _unit(1), save_to_disk=False)
+    assert cache.find_best_matches_batch(_unit(1)[None, :], threshold=0.4)[0][0] == "s2"
+
+
+def test_rebuild_racing_with_set_embedding_is_not_kept():
+    """A set_embedding during a gallery rebuild must not leave the older snapshot cached"""
+    cache = _make_cache()
+    cache.cache = _InterleavingDict()
+    cache.set_embedding("s1", _unit(0), save_to_disk=False)
+    cache.cache.on_snapshot = lambda: cache.set_embedding("s1", _unit(1), save_to_disk=False)
+
+    # This rebuild snapshots the old embedding, then set_embedding replaces it
+    student_ids, matrix = cache._get_gallery()
+    assert student_ids == ["s1"]
+    assert matrix[0, 0] == 1.0
+
+    # The stale rebuild was not stored, so the next lookup sees the new embedding
+    assert cache._gallery is None
+    student_ids, matrix = cache._get_gallery()
+    assert matrix[0, 1] == 1.0
+    assert cache.find_best_matches_batch(_unit(1)[None, :], threshold=0.4)[0][0] == "s1"
+
+
+def test_rebuild_racing_with_delete_is_not_kept():
+    cache = _make_cache()
+    cache.cache = _InterleavingDict()
+    cache.set_embedding("s1", _unit(0), save_to_disk=False)
+    cache.set_embedding("s2", _unit(1), save_to_disk=False)
+    cache.cache.on_snapshot = lambda: cache.delete_embedding("s2", delete_from_disk=False)
+
+    cache._get_gallery()
+
+    assert cache._get_gallery()[0] == ["s1"]
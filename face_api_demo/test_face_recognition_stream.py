@@ -0,0 +1,95 @@
+"""
+Tests for the prefetching image stream in FaceRecognitionService
+Run with: pytest test_face_recognition_stream.py
+"""
+
+import itertools
+import sys
+import threading
+import time
+from pathlib import Path
+
+import pytest
+
+# Add parent directory to path
+sys.path.insert(0, str(Path(__file__).parent))
+
+from services.face_recognition_service import FaceRecognitionService
+
+
+class _FakeProcessor:
+    """Returns the path as the decoded frame, failing for paths listed in fail"""
+
+    def __init__(self, fail=()):
+        self.fail = set(fail)
+
+    def preprocess_image_array(self, path):
+        if path in self.fail:
+            raise ValueError(f"cannot decode {path}")
+        return f"frame:{path}"
+
+    load_image = preprocess_image_array
+
+
+def _make_service(processor=None) -> FaceRecognitionService:
+    # Skip __init__ so no models or cache are loaded
+    service = FaceRecognitionService.__new__(FaceRecognitionService)
+    service.image_processor = processor or _FakeProcessor()
+    service.recognize_faces = lambda image_path, image=None, **kwargs: {
+        'path': image_path,
+        'frame': image
+    }
+    return service
+
+
+def test_results_keep_input_order():
+    paths = [f"img_{i}.jpg" for i in range(20)]
+
+    results = list(_make_service().recognize_stream(paths, save_results=False))
+
+    assert [r['path'] for r in results] == paths
+    assert [r['frame'] for r in results] == [f"frame:{p}" for p in paths]
+
+
+def test_preprocess_failure_yields_none_frame():
+    service = _make_service(_FakeProcessor(fail={"b.jpg"}))
+
+    results = list(service.recognize_stream(["a.jpg", "b.jpg", "c.jpg"], save_results=False))
+
+    assert [r['path'] for r in results] == ["a.jpg", "b.jpg", "c.jpg"]
+    assert [r['frame'] for r in results] == ["frame:a.jpg", None, "frame:c.jpg"]
+
+
+def test_closing_stream_stops_worker():
+    pulled = []
+
+    def endless():
+        for i in itertools.count():
+            pulled.append(i)
+            yield f"img_{i}.jpg"
+
+    stream = _make_service().recognize_stream(endless(), save_results=False)
+    assert next(stream)['path'] == "img_0.jpg"
+
+    # close() waits for the worker; run it on a thread so a hang fails the test
+    closer = threading.Thread(target=stream.close)
+    closer.start()
+    closer.join(timeout=5)
+    assert not closer.is_alive()
+
+    # The worker no longer pulls from the source
+    pulled_at_close = len(pulled)
+    time.sleep(0.3)
+    assert len(pulled) == pulled_at_close
+
+
+def test_source_error_propagates():
+    def failing_source():
+        yield "a.jpg"
+        raise RuntimeError("camera disconnected")
+
+    stream = _make_service().recognize_stream(failing_source(), save_results=False)
+
+    assert next(stream)['path'] == "a.jpg"
+    with pytest.raises(RuntimeError, match="camera disconnected"):
+        next(stream)
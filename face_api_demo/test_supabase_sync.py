@@ -0,0 +1,328 @@
+"""
+Tests for the Supabase class sync against an in-memory Storage API
+Run with: pytest test_supabase_sync.py
+"""
+
+import hashlib
+import io
+import json
+import re
+import sys
+import tarfile
+import urllib.parse
+from pathlib import Path
+
+import httpx
+import pytest
+
+# Add parent directory to path
+sys.path.insert(0, str(Path(__file__).parent))
+
+from config import settings
+from services import supabase_service
+from services.supabase_service import SupabaseService
+
+SUPABASE_URL = "http://supabase.test"
+BUCKET = "faces"
+
+
+def _etag(content: bytes) -> str:
+    return f'"{hashlib.md5(content).hexdigest()}"'
+
+
+class MockStorage:
+    """Storage REST API (list, download) and optional storage.objects table over httpx.MockTransport"""
+
+    def __init__(self, objects, tree_max_rows=None):
+        self.objects = dict(objects)
+        self.tree_max_rows = tree_max_rows
+        self.requests = []
+        self.failures = {}  # object path -> status codes to answer first
+        self.upload_headers = {}  # object path -> headers of its last upload
+        self.transport = httpx.MockTransport(self.handle)
+
+    def gets(self, path=None):
+        return [p for m, p in self.requests if m == "GET" and (path is None or p == path)]
+
+    def lists(self):
+        return [p for m, p in self.requests if m == "LIST"]
+
+    def handle(self, request: httpx.Request) -> httpx.Response:
+        path = urllib.parse.unquote(request.url.path)
+
+        if path == "/rest/v1/objects":
+            self.requests.append(("TREE", path))
+            if self.tree_max_rows is None:
+                return httpx.Response(406, json={"code": "PGRST106", "message": "schema not exposed"})
+            query = dict(urllib.parse.parse_qsl(request.url.query.decode()))
+            names = sorted(name for name in self.objects if name.startswith("students/"))
+            offset = int(query["offset"])
+            page = names[offset:offset + min(int(query["limit"]), self.tree_max_rows)]
+            return httpx.Response(
+                200,
+                json=[{"name": name, "metadata": {"eTag": _etag(self.objects[name])}} for name in page],
+                headers={"content-range": f"{offset}-{offset + len(page) - 1}/{len(names)}"}
+            )
+
+        if path == f"/storage/v1/object/list/{BUCKET}":
+            prefix = json.loads(request.content)["prefix"]
+            self.requests.append(("LIST", prefix))
+            entries = {}
+            for name, content in self.objects.items():
+                if name.startswith(prefix):
+                    rest = name[len(prefix):]
+                    if '/' in rest:
+                        entries.setdefault(rest.split('/')[0], None)
+                    else:
+                        entries[rest] = {"eTag": _etag(content), "size": len(content)}
+            return httpx.Response(200, json=[
+                {"name": name, "id": name if metadata else None, "metadata": metadata}
+                for name, metadata in sorted(entries.items())
+            ])
+
+        match = re.match(rf"/storage/v1/object/{BUCKET}/(.+)$", path)
+        if match and request.method == "GET":
+            name = match.group(1)
+            self.requests.append(("GET", name))
+            pending = self.failures.get(name)
+            if pending:
+                return httpx.Response(pending.pop(0))
+            if name not in self.objects:
+                return httpx.Response(400, json={"error": "not_found"})
+            content = self.objects[name]
+            if request.headers.get("if-none-match") == _etag(content):
+                return httpx.Response(304)
+            return httpx.Response(200, content=content, headers={"etag": _etag(content)})
+        if match and request.method == "POST":
+            name = match.group(1)
+            self.requests.append(("POST", name))
+            self.objects[name] = request.read()
+            self.upload_headers[name] = request.headers
+            return httpx.Response(200, json={"Key": f"{BUCKET}/{name}"})
+
+        return httpx.Response(404)
+
+
+@pytest.fixture
+def make_service(tmp_path, monkeypatch):
+    """Build a SupabaseService talking to a MockStorage"""
+    monkeypatch.setattr(settings, "DATABASE_FOLDER", tmp_path / "db")
+    monkeypatch.setattr(supabase_service, "DOWNLOAD_RETRY_BACKOFF", 0.0)
+    services = []
+
+    def make(storage: MockStorage) -> SupabaseService:
+        service = SupabaseService()
+        service.enabled, service.url, service.key, service.bucket = True, SUPABASE_URL, "key", BUCKET
+        service.storage_url = f"{SUPABASE_URL}/storage/v1"
+        service._http = httpx.AsyncClient(base_url=service.storage_url, transport=storage.transport)
+        services.append(service)
+        return service
+
+    yield make
+    for service in services:
+        service.close()
+
+
+def test_root_image_wins_over_folder_image(make_service, tmp_path):
+    """A student with both students/<id>/x.jpg and students/<id>.jpg is downloaded once, from the root"""
+    folder_image, root_image = b"F" * 300_000, b"R" * 200_000
+    storage = MockStorage({
+        "students/s1/face.jpg": folder_image,
+        "students/s1.jpg": root_image,
+        "students/s2/face.jpg": b"2" * 1000,
+    })
+    service = make_service(storage)
+    class_folder = tmp_path / "class"
+
+    count, _ = service.sync_class_students("c1", class_folder)
+
+    assert count == 2
+    assert (class_folder / "s1.jpg").read_bytes() == root_image
+    assert (class_folder / "s2.jpg").read_bytes() == b"2" * 1000
+    assert storage.gets("students/s1/face.jpg") == []
+    assert not list(class_folder.glob("*.part"))
+
+
+def test_unchanged_images_are_not_downloaded_again(make_service, tmp_path, monkeypatch):
+    """ETag sidecars let a repeat sync skip every download"""
+    monkeypatch.setattr(settings, "SUPABASE_INDEX_TTL", 0)
+    storage = MockStorage({f"students/s{i}/face.jpg": bytes([i]) * 100 for i in range(5)})
+    service = make_service(storage)
+    class_folder = tmp_path / "class"
+
+    assert service.sync_class_students("c1", class_folder)[0] == 5
+    service._list_cache.clear()
+    storage.requests.clear()
+
+    assert service.sync_class_students("c1", class_folder)[0] == 5
+    assert storage.gets() == []
+    assert storage.lists()
+
+
+def test_force_downloads_everything(make_service, tmp_path):
+    storage = MockStorage({"students/s1.jpg": b"one"})
+    service = make_service(storage)
+    class_folder = tmp_path / "class"
+
+    service.sync_class_students("c1", class_folder)
+    storage.objects["students/s1.jpg"] = b"two"
+    service._list_cache.clear()
+
+    assert service.sync_class_students("c1", class_folder, force=True)[0] == 1
+    assert (class_folder / "s1.jpg").read_bytes() == b"two"
+
+
+def test_download_retries_server_errors(make_service, tmp_path):
+    storage = MockStorage({"students/s1.jpg": b"face"})
+    storage.failures["students/s1.jpg"] = [503, 502]
+    service = make_service(storage)
+    class_folder = tmp_path / "class"
+
+    assert service.sync_class_students("c1", class_folder)[0] == 1
+    assert len(storage.gets("students/s1.jpg")) == 3
+    assert (class_folder / "s1.jpg").read_bytes() == b"face"
+
+
+def test_missing_object_is_not_retried(make_service, tmp_path):
+    service = make_service(MockStorage({}))
+
+    success, error = service.download_file("students/missing.jpg", str(tmp_path / "missing.jpg"))
+
+    assert not success
+    assert "not found" in error
+
+
+def test_students_index_skips_listing_until_forced(make_service, tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "SUPABASE_INDEX_TTL", 600)
+    storage = MockStorage({"students/s1/face.jpg": b"a", "students/s2.jpg": b"b"})
+    service = make_service(storage)
+    class_folder = tmp_path / "class"
+
+    assert service.sync_class_students("c1", class_folder)[0] == 2
+    service._list_cache.clear()
+    storage.requests.clear()
+
+    assert service.sync_class_students("c1", class_folder)[0] == 2
+    assert storage.lists() == []
+
+    assert service.sync_class_students("c1", class_folder, force=True)[0] == 2
+    assert storage.lists()
+
+
+def test_manual_sync_lists_instead_of_using_index(make_service, tmp_path, monkeypatch):
+    """Students uploaded by another service appear even while the index is fresh"""
+    monkeypatch.setattr(settings, "SUPABASE_INDEX_TTL", 600)
+    storage = MockStorage({"students/s1.jpg": b"a"})
+    service = make_service(storage)
+    class_folder = tmp_path / "class"
+
+    assert service.sync_class_students("c1", class_folder)[0] == 1
+    storage.objects["students/s2.jpg"] = b"b"
+    service._list_cache.clear()
+
+    assert service.sync_class_students("c1", class_folder)[0] == 1
+    assert service.sync_class_students("c1", class_folder, use_index=False)[0] == 2
+    assert (class_folder / "s2.jpg").read_bytes() == b"b"
+
+
+def test_tree_listing_pages_past_max_rows(make_service, tmp_path):
+    """PostgREST caps pages at max-rows; the listing must keep going to the reported total"""
+    objects = {f"students/s{i:04d}/face.jpg": b"x" for i in range(2500)}
+    storage = MockStorage(objects, tree_max_rows=700)
+    service = make_service(storage)
+
+    student_folders, root_files = service._run(service._list_students_tree_async())
+
+    assert len(student_folders) == 2500
+    assert root_files == []
+    assert service._tree_listing_supported is True
+
+
+def test_tree_listing_unsupported_falls_back_to_folders(make_service, tmp_path):
+    storage = MockStorage({"students/s1/face.jpg": b"a"})
+    service = make_service(storage)
+
+    assert service.sync_class_students("c1", tmp_path / "class")[0] == 1
+    assert service._tree_listing_supported is False
+    assert "students/s1/" in storage.lists()
+
+
+def test_missing_bundle_falls_back_to_students(make_service, tmp_path):
+    storage = MockStorage({"students/s1.jpg": b"a", "students/s2/face.jpg": b"b"})
+    service = make_service(storage)
+
+    count, message = service.sync_class_bundle("c1", tmp_path / "class")
+
+    assert count == 2
+    assert "bundle" not in message
+    assert storage.gets("c1/faces.tar") == ["c1/faces.tar"]
+
+
+def test_download_recreates_a_removed_folder(make_service, tmp_path):
+    """A folder deleted after it was first created is made again instead of failing every download"""
+    storage = MockStorage({"students/s1.jpg": b"a", "students/s2.jpg": b"b"})
+    service = make_service(storage)
+    class_folder = tmp_path / "class"
+
+    assert service.download_file("students/s1.jpg", str(class_folder / "s1.jpg")) == (True, None)
+    (class_folder / "s1.jpg").unlink()
+    class_folder.rmdir()
+
+    assert service.download_file("students/s2.jpg", str(class_folder / "s2.jpg")) == (True, None)
+    assert (class_folder / "s2.jpg").read_bytes() == b"b"
+
+
+def test_only_write_once_uploads_are_cached_forever(make_service, tmp_path):
+    """Overwritable paths keep a short cache lifetime since get_public_url is not versioned"""
+    storage = MockStorage({})
+    service = make_service(storage)
+    image = tmp_path / "face.jpg"
+    image.write_bytes(b"face")
+
+    success, url, _ = service.upload_file(str(image), "students/s1.jpg")
+    assert success and "?v=" in url
+    assert "immutable" not in storage.upload_headers["students/s1.jpg"]["cache-control"]
+
+    url, _ = service.save_student_face(str(image), "s1", "s1_20240101_000000.jpg")
+    headers = storage.upload_headers["students/s1/s1_20240101_000000.jpg"]
+    assert "immutable" in headers["cache-control"]
+    assert storage.objects["students/s1/s1_20240101_000000.jpg"] == b"face"
+
+
+def _make_tar(members) -> bytes:
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode='w') as archive:
+        for name, content in members:
+            info = tarfile.TarInfo(name)
+            info.size = len(content)
+            archive.addfile(info, io.BytesIO(content))
+    return buffer.getvalue()
+
+
+def test_bundle_extracts_student_images(make_service, tmp_path):
+    """Folder and flat members become <id>.jpg; other layouts and unsafe IDs are skipped"""
+    bundle = _make_tar([
+        ("s1/face.jpg", b"first"),
+        ("s1/other.jpg", b"second"),
+        ("./s2.jpg", b"two"),
+        ("s3/sub/x.png", b"nested"),
+        ("..\\evil.jpg", b"evil"),
+        ("C:evil/x.jpg", b"evil"),
+        ("bad id/x.jpg", b"evil"),
+        ("s4/notes.txt", b"text"),
+    ])
+    storage = MockStorage({"c1/faces.tar": bundle})
+    service = make_service(storage)
+    class_folder = tmp_path / "class"
+
+    count, message = service.sync_class_bundle("c1", class_folder)
+
+    assert count == 2
+    assert "bundle" in message
+    assert sorted(p.name for p in class_folder.iterdir()) == [".bundle.etag", "s1.jpg", "s2.jpg"]
+    assert (class_folder / "s1.jpg").read_bytes() == b"second"
+    assert (class_folder / "s2.jpg").read_bytes() == b"two"
+    assert not list(tmp_path.glob("*.jpg"))
+
+    count, message = service.sync_class_bundle("c1", class_folder)
+    assert (count, message) == (2, "Class bundle unchanged")
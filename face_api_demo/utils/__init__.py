@@ -5,8 +5,10 @@ from .validators import (
     validate_image_file,
     validate_uuid,
     validate_student_id,
+    validate_student_ids_bulk,
     validate_class_id,
-    allowed_file
+    allowed_file,
+    TOO_LARGE_MSG
 )
 from .timezone_helper import (
     get_now,
@@ -23,8 +25,10 @@ __all__ = [
     'validate_image_file',
     'validate_uuid',
     'validate_student_id',
+    'validate_student_ids_bulk',
     'validate_class_id',
     'allowed_file',
+    'TOO_LARGE_MSG',
     'get_now',
     'to_local_time',
     'to_utc',
@@ -4,19 +4,40 @@ Helper functions for file operations
 """
 
 import os
+import errno
 import uuid
 import shutil
 from pathlib import Path
 from typing import Optional, Tuple
 import logging
-from werkzeug.utils import secure_filename
 from werkzeug.datastructures import FileStorage
+from werkzeug.utils import secure_filename
 
 from config.settings import settings
 from utils.validators import sanitize_filename
 
 logger = logging.getLogger(__name__)
 
+# Directories already created by this process
+_ENSURED_DIRS = set()
+
+# Copy buffer for saving uploads (werkzeug's FileStorage.save uses 16 KiB)
+UPLOAD_COPY_BUFFER = 1 << 20
+
+
+def _ensure_dir(folder: Path):
+    """Create a directory once per process instead of on every call"""
+    if folder in _ENSURED_DIRS:
+        return
+    folder.mkdir(parents=True, exist_ok=True)
+    _ENSURED_DIRS.add(folder)
+
+
+def _save_stream(file: FileStorage, file_path: str):
+    """Write an uploaded file to disk in UPLOAD_COPY_BUFFER chunks"""
+    with open(file_path, 'wb') as dst:
+        shutil.copyfileobj(file.stream, dst, length=UPLOAD_COPY_BUFFER)
+
 
 class FileHandler:
     """Handler for file operations"""
@@ -47,19 +68,27 @@ class FileHandler:
                 folder = settings.TEMP_FOLDER
             
             # Ensure folder exists
-            folder.mkdir(parents=True, exist_ok=True)
+            _ensure_dir(folder)
             
             # Generate filename
             if custom_filename:
                 filename = sanitize_filename(custom_filename)
             else:
-                # Generate unique filename
-                file_ext = secure_filename(file.filename).rsplit('.', 1)[1].lower()
-                filename = f"{uuid.uuid4()}.{file_ext}"
+                # Generate unique filename, keeping only a safe extension
+                file_ext = os.path.splitext(secure_filename(file.filename))[1].lower()
+                if len(file_ext) < 2:
+                    return None, "File has no extension"
+                filename = f"{uuid.uuid4()}{file_ext}"
             
             # Save file
             file_path = str(folder / filename)
-            file.save(file_path)
+            try:
+                _save_stream(file, file_path)
+            except FileNotFoundError:
+                # Folder was removed since it was first ensured
+                _ENSURED_DIRS.discard(folder)
+                _ensure_dir(folder)
+                _save_stream(file, file_path)
             
             logger.debug(f"File saved: {file_path}")
             return file_path, None
@@ -76,11 +105,15 @@ class FileHandler:
         Args:
             file_path: Path to file to delete
         """
+        if not file_path:
+            return
+        
         try:
-            if file_path and os.path.exists(file_path):
-                os.remove(file_path)
-                logger.debug(f"File deleted: {file_path}")
-        except Exception as e:
+            os.remove(file_path)
+            logger.debug(f"File deleted: {file_path}")
+        except FileNotFoundError:
+            pass
+        except OSError as e:
             logger.warning(f"Could not delete file {file_path}: {e}")
     
     @staticmethod
@@ -93,13 +126,17 @@ class FileHandler:
             recursive: Whether to delete recursively
         """
         try:
-            if folder_path.exists():
-                if recursive:
-                    shutil.rmtree(str(folder_path))
-                else:
-                    folder_path.rmdir()
-                logger.debug(f"Folder deleted: {folder_path}")
-        except Exception as e:
+            if recursive:
+                shutil.rmtree(str(folder_path))
+            else:
+                folder_path.rmdir()
+            _ENSURED_DIRS.difference_update(
+                d for d in list(_ENSURED_DIRS) if d == folder_path or folder_path in d.parents
+            )
+            logger.debug(f"Folder deleted: {folder_path}")
+        except FileNotFoundError:
+            pass
+        except OSError as e:
             logger.warning(f"Could not delete folder {folder_path}: {e}")
     
     @staticmethod
@@ -116,7 +153,7 @@ class FileHandler:
         """
         try:
             # Ensure destination directory exists
-            Path(destination).parent.mkdir(parents=True, exist_ok=True)
+            _ensure_dir(Path(destination).parent)
             
             shutil.copy2(source, destination)
             logger.debug(f"File copied: {source} -> {destination}")
@@ -140,9 +177,15 @@ class FileHandler:
         """
         try:
             # Ensure destination directory exists
-            Path(destination).parent.mkdir(parents=True, exist_ok=True)
+            _ensure_dir(Path(destination).parent)
             
-            shutil.move(source, destination)
+            # A rename when both paths share a filesystem, a copy otherwise
+            try:
+                os.replace(source, destination)
+            except OSError as e:
+                if e.errno != errno.EXDEV:
+                    raise
+                shutil.move(source, destination)
             logger.debug(f"File moved: {source} -> {destination}")
             return True, None
         
@@ -150,6 +193,30 @@ class FileHandler:
             logger.error(f"Error moving file: {e}")
             return False, str(e)
     
+    @staticmethod
+    def has_any_image(folder: Path) -> bool:
+        """
+        Check whether a folder tree contains at least one image
+        Stops at the first image found instead of walking the whole tree
+        
+        Args:
+            folder: Folder to search recursively
+            
+        Returns:
+            True if any .jpg/.jpeg/.png file exists under folder
+        """
+        try:
+            with os.scandir(folder) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        if FileHandler.has_any_image(entry.path):
+                            return True
+                    elif entry.name.lower().endswith(('.jpg', '.jpeg', '.png')):
+                        return True
+        except FileNotFoundError:
+            pass
+        return False
+    
     @staticmethod
     def get_file_size(file_path: str) -> int:
         """
@@ -175,4 +242,4 @@ class FileHandler:
         Args:
             directory: Directory path
         """
-        directory.mkdir(parents=True, exist_ok=True)
+        _ensure_dir(directory)
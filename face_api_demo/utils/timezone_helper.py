@@ -3,12 +3,16 @@ Timezone Utilities for UTC+7 (Indochina Time / Bangkok Time)
 """
 
 from datetime import datetime, timezone, timedelta
-import pytz
+from zoneinfo import ZoneInfo
 
 # Define UTC+7 timezone
-ICT = pytz.timezone('Asia/Bangkok')  # UTC+7
+ICT = ZoneInfo('Asia/Bangkok')  # UTC+7
 UTC_OFFSET = timedelta(hours=7)
 
+# Bound once so the hot timestamp helpers skip module attribute lookups
+_UTC = timezone.utc
+_DT_NOW = datetime.now
+
 
 def get_now() -> datetime:
     """
@@ -17,7 +21,7 @@ def get_now() -> datetime:
     Returns:
         datetime: Current time in UTC+7 timezone
     """
-    return datetime.now(ICT)
+    return _DT_NOW(ICT)
 
 
 def to_local_time(utc_dt: datetime) -> datetime:
@@ -31,7 +35,7 @@ def to_local_time(utc_dt: datetime) -> datetime:
         datetime: Datetime in UTC+7 timezone
     """
     if utc_dt.tzinfo is None:
-        utc_dt = pytz.utc.localize(utc_dt)
+        utc_dt = utc_dt.replace(tzinfo=_UTC)
     return utc_dt.astimezone(ICT)
 
 
@@ -46,8 +50,8 @@ def to_utc(local_dt: datetime) -> datetime:
         datetime: UTC datetime object
     """
     if local_dt.tzinfo is None:
-        local_dt = ICT.localize(local_dt)
-    return local_dt.astimezone(pytz.utc)
+        local_dt = local_dt.replace(tzinfo=ICT)
+    return local_dt.astimezone(_UTC)
 
 
 def get_utc_now_for_storage() -> datetime:
@@ -58,7 +62,7 @@ def get_utc_now_for_storage() -> datetime:
     Returns:
         datetime: Current time in UTC (for database storage)
     """
-    return datetime.now(pytz.utc)
+    return _DT_NOW(_UTC)
 
 
 def format_datetime(dt: datetime, fmt: str = '%Y-%m-%d %H:%M:%S') -> str:
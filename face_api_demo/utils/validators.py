@@ -3,10 +3,13 @@ Input Validation Utilities
 Helper functions for validating user inputs
 """
 
+import io
 import os
-import uuid
+import re
+import string
+from functools import lru_cache
 from pathlib import Path
-from typing import Optional, Tuple
+from typing import Iterable, Optional, Tuple
 import logging
 from werkzeug.datastructures import FileStorage
 
@@ -14,6 +17,37 @@ from config.settings import settings
 
 logger = logging.getLogger(__name__)
 
+# Characters allowed in a student ID
+_STUDENT_ID_CHARS = frozenset(string.ascii_letters + string.digits + '_-')
+
+# Compiled once at import instead of on every validation call
+_SANITIZE_RE = re.compile(r'[^\w\.-]')
+
+# ASCII equivalent of _SANITIZE_RE for str.translate
+_SANITIZE_TABLE = {
+    cp: ord('_') for cp in range(128)
+    if not (chr(cp).isalnum() or chr(cp) in '._-')
+}
+
+# Normalized allowed extensions and the matching error text, built once
+_ALLOWED_EXT = frozenset(e.lower().lstrip('.') for e in settings.ALLOWED_EXTENSIONS)
+_ALLOWED_EXT_MSG = f"File type not allowed. Allowed types: {', '.join(sorted(_ALLOWED_EXT))}"
+_MAX_MB = settings.IMAGE_MAX_SIZE / (1024 * 1024)
+
+# Oversized upload error, shared with the app's 413 handler
+TOO_LARGE_MSG = f"File too large. Maximum size: {_MAX_MB:.1f}MB"
+
+# Literal (bool, str) returns are folded into constants by the compiler;
+# these two carry computed messages, so build their tuples once here
+_ERR_FILE_TYPE = (False, _ALLOWED_EXT_MSG)
+_ERR_TOO_LARGE = (False, TOO_LARGE_MSG)
+
+# IDs repeat across requests within a session, so validation results are memoized
+VALIDATION_CACHE_SIZE = 2048
+
+# Chunk size for the bounded read of non-seekable upload streams
+UPLOAD_READ_CHUNK = 64 * 1024
+
 
 def allowed_file(filename: str) -> bool:
     """
@@ -28,8 +62,51 @@ def allowed_file(filename: str) -> bool:
     if not filename:
         return False
     
-    return '.' in filename and \
-           filename.rsplit('.', 1)[1].lower() in settings.ALLOWED_EXTENSIONS
+    ext = os.path.splitext(filename)[1]
+    return bool(ext) and ext[1:].lower() in _ALLOWED_EXT
+
+
+def _stream_size(file: FileStorage, limit: int) -> int:
+    """
+    Get the size of an upload stream, preferring fstat over seek/tell
+    
+    Non-seekable streams are read into memory, stopping as soon as more
+    than limit bytes have arrived, and the buffered copy replaces the stream.
+    
+    Args:
+        file: Uploaded file object
+        limit: Maximum accepted size in bytes
+        
+    Returns:
+        Size in bytes (any value above limit means too large)
+    """
+    stream = file.stream
+    
+    # fileno() on a spooled file still in memory would force it to disk
+    if getattr(stream, '_rolled', True):
+        try:
+            return os.fstat(stream.fileno()).st_size
+        except (AttributeError, OSError, io.UnsupportedOperation):
+            pass
+    
+    seekable = getattr(stream, 'seekable', None)
+    if seekable is not None and not seekable():
+        buffer = io.BytesIO()
+        size = 0
+        while size <= limit:
+            chunk = stream.read(UPLOAD_READ_CHUNK)
+            if not chunk:
+                break
+            buffer.write(chunk)
+            size += len(chunk)
+        buffer.seek(0)
+        file.stream = buffer
+        return size
+    
+    stream.seek(0, os.SEEK_END)
+    size = stream.tell()
+    stream.seek(0)  # Reset to beginning
+    return size
 
 
 def validate_image_file(file: FileStorage) -> Tuple[bool, Optional[str]]:
@@ -49,17 +126,17 @@ def validate_image_file(file: FileStorage) -> Tuple[bool, Optional[str]]:
         
         # Check file extension
         if not allowed_file(file.filename):
-            allowed = ', '.join(settings.ALLOWED_EXTENSIONS)
-            return False, f"File type not allowed. Allowed types: {allowed}"
+            return _ERR_FILE_TYPE
+        
+        # Reject on the declared part length before touching the stream
+        if file.content_length and file.content_length > settings.IMAGE_MAX_SIZE:
+            return _ERR_TOO_LARGE
         
         # Check file size (if we can read it)
-        file.seek(0, os.SEEK_END)
-        file_size = file.tell()
-        file.seek(0)  # Reset to beginning
+        file_size = _stream_size(file, settings.IMAGE_MAX_SIZE)
         
         if file_size > settings.IMAGE_MAX_SIZE:
-            max_mb = settings.IMAGE_MAX_SIZE / (1024 * 1024)
-            return False, f"File too large. Maximum size: {max_mb:.1f}MB"
+            return _ERR_TOO_LARGE
         
         if file_size == 0:
             return False, "File is empty"
@@ -81,8 +158,28 @@ def validate_uuid(uuid_string: str) -> Tuple[bool, Optional[str]]:
     Returns:
         Tuple of (is_valid, error_message)
     """
+    # Only strings of a UUID's length reach the cache, so arbitrary
+    # request input is never kept as a cache key
+    if not isinstance(uuid_string, str) or len(uuid_string) not in (32, 36):
+        return False, "Invalid UUID format"
+    
+    return _validate_uuid_cached(uuid_string)
+
+
+@lru_cache(maxsize=VALIDATION_CACHE_SIZE)
+def _validate_uuid_cached(uuid_string: str) -> Tuple[bool, Optional[str]]:
+    # Cheap shape check first, so malformed input never pays for
+    # the hex decode's exception path
+    if len(uuid_string) == 36 and not (
+        uuid_string[8] == uuid_string[13] == uuid_string[18] == uuid_string[23] == '-'
+    ):
+        return False, "Invalid UUID format"
+    
+    # Decoding the hex is all uuid.UUID would check; fromhex skips
+    # whitespace, so the byte count catches anything but 32 hex digits
     try:
-        uuid.UUID(uuid_string)
+        if len(bytes.fromhex(uuid_string.replace('-', ''))) != 16:
+            return False, "Invalid UUID format"
         return True, None
     except ValueError:
         return False, "Invalid UUID format"
@@ -100,21 +197,55 @@ def validate_student_id(student_id: str) -> Tuple[bool, Optional[str]]:
     Returns:
         Tuple of (is_valid, error_message)
     """
-    if not student_id or not student_id.strip():
+    if not student_id:
         return False, "Student ID cannot be empty"
     
+    # Oversized IDs are rejected before the cache so they are never kept as keys
     if len(student_id) > 100:
+        if not student_id.strip():
+            return False, "Student ID cannot be empty"
         return False, "Student ID too long (max 100 characters)"
     
+    return _validate_student_id_cached(student_id)
+
+
+@lru_cache(maxsize=VALIDATION_CACHE_SIZE)
+def _validate_student_id_cached(student_id: str) -> Tuple[bool, Optional[str]]:
+    # Only strip when an end is whitespace; clean IDs skip the copy
+    if (student_id[0].isspace() or student_id[-1].isspace()) and not student_id.strip():
+        return False, "Student ID cannot be empty"
+    
     # Check for invalid characters (optional - adjust as needed)
     # Allow alphanumeric, hyphens, underscores
-    import re
-    if not re.match(r'^[a-zA-Z0-9_-]+$', student_id):
+    if not _STUDENT_ID_CHARS.issuperset(student_id):
         return False, "Student ID can only contain letters, numbers, hyphens, and underscores"
     
     return True, None
 
 
+def validate_student_ids_bulk(
+    student_ids: Iterable[str]
+) -> Tuple[bool, Optional[int], Optional[str]]:
+    """
+    Validate a batch of student IDs, stopping at the first invalid one
+    
+    Args:
+        student_ids: Student IDs to validate
+        
+    Returns:
+        Tuple of (is_valid, failing_index, error_message)
+    """
+    allowed = _STUDENT_ID_CHARS
+    for index, student_id in enumerate(student_ids):
+        if (not student_id or len(student_id) > 100
+                or not allowed.issuperset(student_id)):
+            # Same message the single-ID validator would give
+            _, error = validate_student_id(student_id)
+            return False, index, error
+    
+    return True, None, None
+
+
 def validate_class_id(class_id: str) -> Tuple[bool, Optional[str]]:
     """
     Validate class ID format
@@ -125,12 +256,31 @@ def validate_class_id(class_id: str) -> Tuple[bool, Optional[str]]:
     Returns:
         Tuple of (is_valid, error_message)
     """
-    if not class_id or not class_id.strip():
+    if not class_id:
         return False, "Class ID cannot be empty"
     
+    if not isinstance(class_id, str):
+        return False, "Class ID must be a string"
+    
+    # Oversized IDs are rejected before the cache so they are never kept as keys
     if len(class_id) > 100:
+        if not class_id.strip():
+            return False, "Class ID cannot be empty"
         return False, "Class ID too long (max 100 characters)"
     
+    return _validate_class_id_cached(class_id)
+
+
+@lru_cache(maxsize=VALIDATION_CACHE_SIZE)
+def _validate_class_id_cached(class_id: str) -> Tuple[bool, Optional[str]]:
+    # Only strip when an end is whitespace; clean IDs skip the copy
+    if (class_id[0].isspace() or class_id[-1].isspace()) and not class_id.strip():
+        return False, "Class ID cannot be empty"
+    
+    # Class IDs name local folders and Storage paths
+    if '/' in class_id or '\\' in class_id or class_id.strip() in ('.', '..'):
+        return False, "Class ID cannot contain path separators"
+    
     return True, None
 
 
@@ -144,6 +294,11 @@ def validate_confidence_threshold(threshold: float) -> Tuple[bool, Optional[str]
     Returns:
         Tuple of (is_valid, error_message)
     """
+    # JSON/form input may be a string, None or a bool; reject those
+    # up front instead of letting the comparison raise TypeError
+    if isinstance(threshold, bool) or not isinstance(threshold, (int, float)):
+        return False, "Confidence threshold must be a number"
+    
     if not 0.0 <= threshold <= 1.0:
         return False, "Confidence threshold must be between 0.0 and 1.0"
     
@@ -164,21 +319,16 @@ def sanitize_filename(filename: str) -> str:
     filename = os.path.basename(filename)
     
     # Remove any non-alphanumeric characters except dots, hyphens, underscores
-    import re
-    filename = re.sub(r'[^\w\.-]', '_', filename)
+    if filename.isascii():
+        return filename.translate(_SANITIZE_TABLE)
+    
+    # Unicode names keep the regex so \w still accepts non-ASCII letters
+    # (most names are already clean, so skip the substitution for those)
+    if _SANITIZE_RE.search(filename):
+        filename = _SANITIZE_RE.sub('_', filename)
     
     return filename
 
 
-def validate_session_id(session_id: str) -> Tuple[bool, Optional[str]]:
-    """
-    Validate session ID format
-    
-    Args:
-        session_id: Session ID to validate
-        
-    Returns:
-        Tuple of (is_valid, error_message)
-    """
-    # Session IDs should be UUIDs
-    return validate_uuid(session_id)
+# Session IDs should be UUIDs; aliased to skip a delegating call frame
+validate_session_id = validate_uuid